@@ -0,0 +1,323 @@
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+BUNDLE_PREFIX = "queries/bundles"
+MANIFEST_PREFIX = "queries/manifests"
+
+# A bundle is uploaded once it holds BUNDLE_MAX_BYTES (compressed) or has been
+# open for BUNDLE_MAX_SECONDS, whichever comes first
+BUNDLE_MAX_BYTES = int(os.getenv('S3_BUNDLE_MAX_BYTES', 16 * 1024 * 1024))
+BUNDLE_MAX_SECONDS = float(os.getenv('S3_BUNDLE_MAX_SECONDS', 60))
+# Sealed bundles waiting for upload before add() blocks; memory stays around
+# (BUNDLE_MAX_PENDING + 1) x BUNDLE_MAX_BYTES
+BUNDLE_MAX_PENDING = int(os.getenv('S3_BUNDLE_MAX_PENDING', 4))
+# Attempts per bundle upload, BUNDLE_RETRY_BACKOFF seconds apart (doubling),
+# before the bundle is spilled to BUNDLE_SPILL_DIR and retried from there
+UPLOAD_ATTEMPTS = int(os.getenv('S3_BUNDLE_UPLOAD_ATTEMPTS', 3))
+RETRY_BACKOFF = float(os.getenv('S3_BUNDLE_RETRY_BACKOFF', 1))
+SPILL_DIR = os.getenv('S3_BUNDLE_SPILL_DIR', '/tmp/s3-bundles')
+GZIP_LEVEL = int(os.getenv('S3_ARCHIVE_GZIP_LEVEL', 6))
+
+# Sentinel used to stop the upload thread
+_STOP = object()
+
+def partition_path(timestamp: datetime) -> str:
+    """Hive-style date/hour partition of a bundle"""
+    return f"dt={timestamp:%Y-%m-%d}/hour={timestamp:%H}"
+
+def manifest_key(bundle_key: str) -> str:
+    """Key of the manifest describing the bundle at bundle_key"""
+    path = bundle_key[len(BUNDLE_PREFIX) + 1:].replace(".ndjson.gz", ".json")
+    return f"{MANIFEST_PREFIX}/{path}"
+
+def record_line(query_id: str, document: bytes) -> bytes:
+    """NDJSON line of a bundle: the json archive document with query_id added first"""
+    return b'{"query_id": ' + json.dumps(query_id).encode('utf-8') + b', ' + document[1:] + b'\n'
+
+class Bundle:
+    """Query archives of one partition, each compressed as its own gzip member.
+
+    Concatenated gzip members are a valid gzip file, so the whole bundle reads
+    as NDJSON with any gzip tool, while the byte range of a single member (see
+    the manifest) decompresses to just that archive.
+    """
+
+    def __init__(self, partition: str):
+        self.partition = partition
+        self.key = f"{BUNDLE_PREFIX}/{partition}/{uuid.uuid4().hex}.ndjson.gz"
+        self.body = bytearray()
+        self.records = []
+        self.opened = time.monotonic()
+
+    def append(self, query_id: str, member: bytes, **fields):
+        self.records.append({"query_id": query_id, "offset": len(self.body), "length": len(member), **fields})
+        self.body += member
+
+    def manifest(self) -> dict:
+        return {
+            "bundle": self.key,
+            "partition": self.partition,
+            "bytes": len(self.body),
+            "record_count": len(self.records),
+            "records": self.records,
+        }
+
+class ArchiveBundler:
+    """Packs query archives into partitioned bundles uploaded from a background thread.
+
+    Instead of one small object per query, add() appends the archive to the
+    open bundle of the current hour and returns its locator,
+    "{bundle key}#{query id}". Full, expired or previous-hour bundles are
+    sealed and uploaded together with a manifest (under MANIFEST_PREFIX) that
+    maps each query id to its byte range in the bundle.
+
+    Callers already hold locators, so a bundle is never dropped: failed
+    uploads are retried with backoff, then written to `spill_dir` and
+    uploaded from there later (by this or another process). close() spills
+    whatever it cannot upload before its deadline.
+    """
+
+    def __init__(self, put_fn, max_bytes=BUNDLE_MAX_BYTES, max_seconds=BUNDLE_MAX_SECONDS,
+                 max_pending=BUNDLE_MAX_PENDING, attempts=UPLOAD_ATTEMPTS, retry_backoff=RETRY_BACKOFF,
+                 spill_dir=SPILL_DIR):
+        self.put_fn = put_fn
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.attempts = max(1, attempts)
+        self.retry_backoff = retry_backoff
+        self.spill_dir = spill_dir
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._bundle = None
+        self._thread = None
+        self._closing = threading.Event()
+        self._next_recovery = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "records": 0,
+            "bundles": 0,
+            "bytes": 0,
+            "retries": 0,
+            "spilled": 0,
+            "recovered": 0,
+            "failed": 0,
+        }
+
+    def start(self):
+        """Start the upload thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._closing.clear()
+            self._thread = threading.Thread(target=self._run, name="s3-bundler", daemon=True)
+            self._thread.start()
+            logger.info("Started S3 archive bundler")
+
+    def add(self, query_id: str, document: bytes, timestamp: datetime, **fields) -> str:
+        """Buffer one json archive document; returns where it will be stored"""
+        self.start()
+        member = gzip.compress(record_line(query_id, document), compresslevel=GZIP_LEVEL)
+        partition = partition_path(timestamp)
+        sealed = []
+        with self._lock:
+            if self._bundle is not None and self._bundle.partition != partition:
+                sealed.append(self._bundle)
+                self._bundle = None
+            if self._bundle is None:
+                self._bundle = Bundle(partition)
+            bundle = self._bundle
+            bundle.append(query_id, member, timestamp=timestamp.isoformat(), **fields)
+            self._stats["records"] += 1
+            if len(bundle.body) >= self.max_bytes:
+                sealed.append(bundle)
+                self._bundle = None
+        # Outside the lock: a full queue makes the caller wait for uploads
+        for full in sealed:
+            self._queue.put(full)
+        return f"{bundle.key}#{query_id}"
+
+    def flush(self, timeout=None):
+        """Upload the open bundle and wait for every sealed one. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            bundle, self._bundle = self._bundle, None
+        if bundle is not None:
+            try:
+                self._queue.put(bundle, timeout=timeout)
+            except queue.Full:
+                self._requeue(bundle)
+                return False
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Flush buffered archives and stop the upload thread within `timeout` seconds.
+
+        Bundles that could not be uploaded in time are spilled to disk.
+        """
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        # From here on failed uploads are spilled instead of retried
+        self._closing.set()
+        flushed = self.flush(timeout)
+        if not flushed:
+            logger.error(f"S3 bundler flush timed out, spilling {self._queue.qsize()} bundles to {self.spill_dir}")
+            with self._lock:
+                bundle, self._bundle = self._bundle, None
+            if bundle is not None:
+                self._spill(bundle)
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._spill(item)
+                self._queue.task_done()
+        self._queue.put(_STOP)
+        self._thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        if self._thread.is_alive():
+            logger.error("S3 bundler still uploading at shutdown, its current bundle may be lost")
+        self._thread = None
+
+    def stats(self):
+        """Return a snapshot of the bundler counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["open_records"] = len(self._bundle.records) if self._bundle is not None else 0
+        snapshot["pending_bundles"] = self._queue.qsize()
+        return snapshot
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=min(self.max_seconds, 1.0))
+            except queue.Empty:
+                self._upload_expired()
+                self._recover_spilled()
+                continue
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            self._upload(item)
+            self._queue.task_done()
+
+    def _upload_expired(self):
+        # Sealed through the queue so that flush() waits for it too; when the
+        # queue is full the bundle stays open until there is room
+        with self._lock:
+            bundle = self._bundle
+            if bundle is None or time.monotonic() - bundle.opened < self.max_seconds:
+                return
+            try:
+                self._queue.put_nowait(bundle)
+            except queue.Full:
+                return
+            self._bundle = None
+
+    def _requeue(self, bundle):
+        """Put a bundle taken for flushing back as the open one, or spill it"""
+        with self._lock:
+            if self._bundle is None:
+                self._bundle = bundle
+                return
+        self._spill(bundle)
+
+    def _put_bundle(self, key, body, manifest):
+        self.put_fn(
+            key, body, ContentType="application/gzip",
+            Metadata={"archive-format": "bundle", "record-count": str(manifest["record_count"])}
+        )
+        # Written last, so every manifest points at a complete bundle
+        self.put_fn(manifest_key(key), json.dumps(manifest).encode('utf-8'), ContentType="application/json")
+
+    def _upload(self, bundle):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                self._put_bundle(bundle.key, bytes(bundle.body), bundle.manifest())
+                with self._lock:
+                    self._stats["bundles"] += 1
+                    self._stats["bytes"] += len(bundle.body)
+                return
+            except Exception as e:
+                logger.warning(f"Upload of S3 bundle {bundle.key} failed (attempt {attempt}/{self.attempts}): {str(e)}")
+            if attempt == self.attempts or self._closing.wait(self.retry_backoff * 2 ** (attempt - 1)):
+                break
+            with self._lock:
+                self._stats["retries"] += 1
+        self._spill(bundle)
+
+    def _spill(self, bundle):
+        """Keep a bundle that could not be uploaded on disk; the manifest is written last"""
+        path = os.path.join(self.spill_dir, bundle.key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(bundle.body)
+            manifest_path = os.path.join(self.spill_dir, manifest_key(bundle.key))
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+            with open(manifest_path, "w") as f:
+                json.dump(bundle.manifest(), f)
+        except OSError as e:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.error(f"S3 bundle {bundle.key} lost, {len(bundle.records)} archives not stored: {str(e)}")
+            return
+        with self._lock:
+            self._stats["spilled"] += 1
+        logger.error(f"S3 bundle {bundle.key} ({len(bundle.records)} archives) kept in {path} for a later upload")
+
+    def _recover_spilled(self):
+        """Upload bundles spilled to disk, at most once per max_seconds"""
+        now = time.monotonic()
+        if self._closing.is_set() or now < self._next_recovery:
+            return
+        self._next_recovery = now + self.max_seconds
+        for manifest_path in glob.glob(os.path.join(self.spill_dir, MANIFEST_PREFIX, "**", "*.json"), recursive=True):
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                bundle_path = os.path.join(self.spill_dir, manifest["bundle"])
+                with open(bundle_path, "rb") as f:
+                    body = f.read()
+            except (OSError, ValueError):
+                continue  # being written or already recovered by another worker
+            try:
+                self._put_bundle(manifest["bundle"], body, manifest)
+            except Exception as e:
+                logger.warning(f"S3 still unavailable for spilled bundles: {str(e)}")
+                return
+            for path in (manifest_path, bundle_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._stats["recovered"] += 1
+            logger.info(f"Uploaded spilled S3 bundle {manifest['bundle']}")
+
+def read_bundled_archive(s3_client, bucket: str, locator: str) -> dict:
+    """Fetch one archive from a bundle with a ranged GET, using the bundle's manifest"""
+    bundle_key, query_id = locator.split("#", 1)
+    manifest = json.loads(s3_client.get_object(Bucket=bucket, Key=manifest_key(bundle_key))["Body"].read())
+    record = next((r for r in manifest["records"] if r["query_id"] == query_id), None)
+    if record is None:
+        raise KeyError(f"{query_id} is not in bundle {bundle_key}")
+    end = record["offset"] + record["length"] - 1
+    response = s3_client.get_object(Bucket=bucket, Key=bundle_key, Range=f"bytes={record['offset']}-{end}")
+    return json.loads(gzip.decompress(response["Body"].read()))
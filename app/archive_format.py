@@ -0,0 +1,122 @@
+import gzip
+import json
+import os
+from typing import Optional
+
+import zstandard
+
+FORMATS = ("json", "ndjson", "columnar")
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+ARCHIVE_FORMAT = os.getenv('S3_ARCHIVE_FORMAT', 'json').lower()
+ARCHIVE_COMPRESSION = os.getenv('S3_ARCHIVE_COMPRESSION', 'none').lower()
+GZIP_LEVEL = int(os.getenv('S3_ARCHIVE_GZIP_LEVEL', 6))
+ZSTD_LEVEL = int(os.getenv('S3_ARCHIVE_ZSTD_LEVEL', 3))
+
+EXTENSIONS = {"json": ".json", "ndjson": ".ndjson", "columnar": ".columnar.json"}
+CONTENT_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson", "columnar": "application/json"}
+COMPRESSED_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+class ArchiveFormat:
+    """How query archives are laid out and compressed in S3.
+
+    json      {"timestamp", "query_parameters", "results": [{...}, ...], "result_count"}
+    ndjson    a header line {"timestamp", "query_parameters"} followed by one row per line
+    columnar  like json, but "results" maps each field to an array of values
+
+    The format and compression are recorded in the object metadata
+    (archive-format, archive-compression) and in Content-Type/Content-Encoding.
+    """
+
+    def __init__(self, fmt: str = ARCHIVE_FORMAT, compression: str = ARCHIVE_COMPRESSION):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown archive format {fmt!r}, expected one of {', '.join(FORMATS)}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown archive compression {compression!r}, expected one of {', '.join(COMPRESSIONS)}")
+        self.format = fmt
+        self.compression = compression
+
+    def for_stream(self) -> "ArchiveFormat":
+        """Format used for archives written row by row; columnar needs every row up front"""
+        if self.format == "columnar":
+            return ArchiveFormat("ndjson", self.compression)
+        return self
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.format] + COMPRESSED_EXTENSIONS[self.compression]
+
+    def put_args(self, result_count: Optional[int] = None) -> dict:
+        """Content headers and metadata for put_object / create_multipart_upload"""
+        metadata = {"archive-format": self.format, "archive-compression": self.compression}
+        if result_count is not None:
+            metadata["result-count"] = str(result_count)
+        args = {"ContentType": CONTENT_TYPES[self.format], "Metadata": metadata}
+        if self.compression != "none":
+            args["ContentEncoding"] = self.compression
+        return args
+
+    def encode(self, document: dict) -> bytes:
+        """Serialize and compress a complete archive document"""
+        return self.compress(self.serialize(document))
+
+    def serialize(self, document: dict) -> bytes:
+        rows = document["results"]
+        # Rows already encoded once (EncodedRows) are spliced in as bytes
+        encoded = getattr(rows, "encoded", None)
+        if self.format == "ndjson":
+            header = self.header(document["timestamp"], document["query_parameters"]).encode('utf-8') + b'\n'
+            if encoded is not None:
+                return header + rows.ndjson()
+            return header + b''.join(json.dumps(row, default=str).encode('utf-8') + b'\n' for row in rows)
+        if self.format == "json" and encoded is not None:
+            head = json.dumps(
+                {"timestamp": document["timestamp"], "query_parameters": document["query_parameters"]}, default=str
+            )
+            tail = f', "result_count": {document["result_count"]}}}'.encode('utf-8')
+            return head[:-1].encode('utf-8') + b', "results": ' + rows.json_array() + tail
+        if self.format == "columnar":
+            fields = list(rows[0]) if rows else []
+            document = {**document, "results": {field: [row.get(field) for row in rows] for field in fields}}
+        return json.dumps(document, default=str).encode('utf-8')
+
+    @staticmethod
+    def header(timestamp: str, query_params: dict) -> str:
+        """First line of an NDJSON archive"""
+        return json.dumps({"timestamp": timestamp, "query_parameters": query_params}, default=str)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=GZIP_LEVEL)
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        return data
+
+    def compressor(self, fileobj):
+        """Writable wrapper that compresses into fileobj; closing it leaves fileobj open"""
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=GZIP_LEVEL)
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(fileobj, closefd=False)
+        return fileobj
+
+def decode_archive(body: bytes, metadata: dict) -> dict:
+    """Read an archive back into the json layout, using its S3 metadata"""
+    compression = metadata.get("archive-compression", "none")
+    if compression == "gzip":
+        body = gzip.decompress(body)
+    elif compression == "zstd":
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+    fmt = metadata.get("archive-format", "json")
+    if fmt == "ndjson":
+        lines = body.decode('utf-8').splitlines()
+        document = json.loads(lines[0])
+        document["results"] = [json.loads(line) for line in lines[1:] if line]
+        document["result_count"] = len(document["results"])
+        return document
+    document = json.loads(body)
+    if fmt == "columnar":
+        columns = document["results"]
+        document["results"] = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return document
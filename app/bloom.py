@@ -0,0 +1,40 @@
+import hashlib
+import math
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings.
+
+    Membership tests never miss an added item and wrongly match an absent one
+    with probability `error_rate` while at most `capacity` items are held.
+    Past that the filter is cleared, so it tracks the most recent items only.
+    Concurrent use from threads is safe in the sense that matters here: a
+    lost update only forgets an item.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        if self.count >= self.capacity:
+            self.clear()
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
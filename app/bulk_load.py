@@ -0,0 +1,186 @@
+import csv
+import io
+import os
+import time
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from aws_lambda_powertools import Logger
+
+# Smart import system that works in all environments
+try:
+    # First try relative imports (works in Docker)
+    from .database import engine, create_indexes, create_tables
+    from .models import User
+    from .user_generator import generate_users
+    from .crud import COLUMNS, prefilter_emails, remember_emails, write_users
+except (ImportError, ValueError):
+    try:
+        # Then try absolute imports with 'app' prefix (works in tests)
+        from app.database import engine, create_indexes, create_tables
+        from app.models import User
+        from app.user_generator import generate_users
+        from app.crud import COLUMNS, prefilter_emails, remember_emails, write_users
+    except ImportError:
+        # Finally try direct imports (works in Lambda)
+        from database import engine, create_indexes, create_tables
+        from models import User
+        from user_generator import generate_users
+        from crud import COLUMNS, prefilter_emails, remember_emails, write_users
+
+logger = Logger()
+
+# Rows per COPY/INSERT round trip (and per commit)
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 10000))
+BULK_MAX_COUNT = int(os.getenv("BULK_MAX_COUNT", 50_000_000))
+# Processes used to generate rows; 1 generates in the loading thread
+GENERATOR_WORKERS = int(os.getenv("GENERATOR_WORKERS", 1))
+
+def chunked(rows: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most `size` items"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+STAGING_TABLE = "users_staging"
+
+def _merge_staged(on_conflict: str) -> str:
+    """INSERT ... SELECT moving the staged rows into users, returning (xmax = 0) per row written"""
+    columns = ", ".join(COLUMNS)
+    if on_conflict == "skip":
+        action = "DO NOTHING"
+    else:
+        action = "DO UPDATE SET name = EXCLUDED.name, age = EXCLUDED.age, city = EXCLUDED.city"
+    # DISTINCT ON keeps one row per email: ON CONFLICT cannot change a row twice
+    return (
+        f"INSERT INTO {User.__tablename__} ({columns}) "
+        f"SELECT DISTINCT ON (email) {columns} FROM {STAGING_TABLE} "
+        f"ON CONFLICT (email) {action} RETURNING (xmax = 0)"
+    )
+
+def copy_users(rows: Iterable, chunk_size: int = BULK_CHUNK_SIZE, on_conflict: str = "skip") -> dict:
+    """Stream rows into the users table with COPY FROM STDIN (psycopg2 only).
+
+    COPY has no ON CONFLICT, so unless on_conflict is "error" each chunk is
+    copied into a temporary staging table and merged with INSERT ... SELECT
+    ... ON CONFLICT (email), in the same transaction.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    target = User.__tablename__ if on_conflict == "error" else STAGING_TABLE
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            if on_conflict != "error":
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} ON COMMIT DELETE ROWS AS "
+                    f"SELECT {', '.join(COLUMNS)} FROM {User.__tablename__} WITH NO DATA"
+                )
+                conn.commit()
+            for chunk in chunked(rows, chunk_size):
+                candidates = prefilter_emails(chunk, on_conflict)
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(candidates)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {target} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                if on_conflict == "error":
+                    counts["inserted"] += len(chunk)
+                else:
+                    cursor.execute(_merge_staged(on_conflict))
+                    written = [inserted for (inserted,) in cursor.fetchall()]
+                    inserted = sum(written)
+                    counts["inserted"] += inserted
+                    counts["updated"] += len(written) - inserted
+                    counts["skipped"] += len(chunk) - len(written)
+                conn.commit()
+                remember_emails(candidates, on_conflict)
+                logger.debug(f"Copied {counts['inserted']} users")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return counts
+
+def insert_users(rows: Iterable, chunk_size: int = BULK_CHUNK_SIZE, on_conflict: str = "skip") -> dict:
+    """Insert rows with multi-row INSERT ... VALUES statements, one transaction per chunk"""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    for chunk in chunked(rows, chunk_size):
+        with engine.begin() as conn:
+            for key, value in write_users(conn, chunk, on_conflict).items():
+                counts[key] += value
+        logger.debug(f"Inserted {counts['inserted']} users")
+    return counts
+
+def bulk_load_users(
+    count: int,
+    unique: Optional[str] = None,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    method: str = "auto",
+    seed: Optional[int] = None,
+    workers: int = GENERATOR_WORKERS,
+    on_conflict: str = "skip"
+) -> dict:
+    """Generate and load `count` users, committing once per chunk.
+
+    `method` is "copy", "insert" or "auto" (COPY when the driver is psycopg2).
+    Rows are produced lazily, so memory is bounded by a few chunks. The same
+    `seed` reproduces the same rows, and with on_conflict "skip" (or
+    "update") reloading them is a no-op instead of an error. Returns the
+    inserted, updated and skipped counts, elapsed time and throughput.
+    """
+    if method == "auto":
+        method = "copy" if engine.dialect.driver == "psycopg2" else "insert"
+    elif method == "copy" and engine.dialect.driver != "psycopg2":
+        raise ValueError(f"COPY requires the psycopg2 driver, not {engine.dialect.driver}")
+    load = copy_users if method == "copy" else insert_users
+
+    start = time.perf_counter()
+    rows = generate_users(count, unique, seed, batch_size=chunk_size, workers=workers)
+    counts = load(rows, chunk_size, on_conflict)
+    elapsed = time.perf_counter() - start
+    total = counts["inserted"] + counts["updated"] + counts["skipped"]
+
+    stats = {
+        "rows": counts["inserted"],
+        **counts,
+        "on_conflict": on_conflict,
+        "method": method,
+        "chunk_size": chunk_size,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total / elapsed) if elapsed > 0 else total
+    }
+    logger.info(
+        f"Bulk loaded {total} users via {method} at {stats['rows_per_second']} rows/sec "
+        f"({counts['inserted']} inserted, {counts['updated']} updated, {counts['skipped']} skipped)"
+    )
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Seed the users table with generated rows")
+    parser.add_argument("--count", type=int, default=0, help="users to load; 0 only creates the schema and indexes")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+    parser.add_argument("--method", choices=["auto", "copy", "insert"], default="auto")
+    parser.add_argument("--unique", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=GENERATOR_WORKERS)
+    parser.add_argument("--on-conflict", choices=["error", "skip", "update"], default="skip")
+    parser.add_argument("--skip-indexes", action="store_true", help="do not build the search and covering indexes")
+    args = parser.parse_args()
+
+    create_tables()
+    stats = bulk_load_users(
+        args.count, args.unique, args.chunk_size, args.method, args.seed, args.workers, args.on_conflict
+    )
+    # After the load, so the rows are indexed in one pass instead of row by row
+    if not args.skip_indexes:
+        stats["indexes"] = create_indexes(engine)
+    print(json.dumps(stats))
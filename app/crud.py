@@ -0,0 +1,306 @@
+import os
+import time
+from typing import Iterable, Optional, List, Tuple
+
+from sqlalchemy import delete, func, insert, literal, literal_column, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+# Smart import system that works in all environments
+try:
+    # First try relative imports (works in Docker)
+    from .models import User
+    from .user_generator import generate_users
+    from .bloom import BloomFilter
+except (ImportError, ValueError):
+    try:
+        # Then try absolute imports with 'app' prefix (works in tests)
+        from app.models import User
+        from app.user_generator import generate_users
+        from app.bloom import BloomFilter
+    except ImportError:
+        # Finally try direct imports (works in Lambda)
+        from models import User
+        from user_generator import generate_users
+        from bloom import BloomFilter
+
+# Rows removed per DELETE statement (and per commit) by delete_users
+DELETE_BATCH_SIZE = int(os.getenv("USERS_DELETE_BATCH_SIZE", 5000))
+
+# Columns of the generated (name, email, age, city) rows
+COLUMNS = ("name", "email", "age", "city")
+# What to do with a row whose email is taken: "error" fails the statement,
+# "skip" keeps the existing user, "update" overwrites its name, age and city
+ON_CONFLICT_MODES = ("error", "skip", "update")
+# Rows per multi-row INSERT: 4 bind parameters each must stay under SQLite's
+# 32766 variables and the 65535 parameters of server-side binding drivers
+MAX_INSERT_PARAMS = int(os.getenv("USERS_INSERT_MAX_PARAMS", 32000))
+MAX_INSERT_ROWS = max(1, MAX_INSERT_PARAMS // len(COLUMNS))
+
+# Optional per-process Bloom filter of recently written emails; in "skip" mode
+# rows it matches are dropped before reaching the database. A false positive
+# (USERS_EMAIL_BLOOM_ERROR_RATE) drops a new row, so it is off by default.
+EMAIL_BLOOM_CAPACITY = int(os.getenv("USERS_EMAIL_BLOOM_CAPACITY", 0))
+recent_emails = BloomFilter(
+    EMAIL_BLOOM_CAPACITY, float(os.getenv("USERS_EMAIL_BLOOM_ERROR_RATE", 0.001))
+) if EMAIL_BLOOM_CAPACITY > 0 else None
+# Deletes through this process clear the filter at once; deletes made by other
+# processes are only seen once the filter has been reset after this many seconds
+EMAIL_BLOOM_TTL = float(os.getenv("USERS_EMAIL_BLOOM_TTL_SECONDS", 300))
+_emails_since = time.monotonic()
+
+# These functions take a plain sync Session. The route handlers call them through
+# database.run_in_session, which runs them via AsyncSession.run_sync in async mode
+# or in the threadpool in sync mode, so the event loop never blocks on the DB.
+
+def prefilter_emails(rows: List[Tuple], on_conflict: str) -> List[Tuple]:
+    """Drop rows whose email recent_emails has seen (only in "skip" mode)"""
+    if on_conflict != "skip" or recent_emails is None:
+        return rows
+    if time.monotonic() - _emails_since > EMAIL_BLOOM_TTL:
+        forget_emails()
+    return [row for row in rows if row[1] not in recent_emails]
+
+def remember_emails(rows: Iterable[Tuple], on_conflict: str):
+    """Record emails that are now known to be in the table"""
+    if on_conflict != "error" and recent_emails is not None:
+        for row in rows:
+            recent_emails.add(row[1])
+
+def forget_emails():
+    """Clear recent_emails, e.g. because users were deleted"""
+    global _emails_since
+    if recent_emails is not None:
+        recent_emails.clear()
+    _emails_since = time.monotonic()
+
+def _upsert(dialect_name: str):
+    if dialect_name == "postgresql":
+        # xmax is 0 for a freshly inserted row version, set for an updated one
+        return postgresql.insert, literal_column("xmax = 0")
+    if dialect_name == "sqlite":
+        # SQLite cannot tell the two apart: updated rows count as inserted
+        return sqlite.insert, literal(True)
+    raise ValueError(f"on_conflict is not supported on {dialect_name}")
+
+def write_users(conn, rows: List[Tuple], on_conflict: str = "skip") -> dict:
+    """Insert (name, email, age, city) rows with multi-row statements on a Connection.
+
+    Each INSERT holds at most MAX_INSERT_ROWS rows, keeping its bind
+    parameters under the driver limit. Returns the inserted, updated and
+    skipped counts. With "skip" or "update" a taken email never fails the
+    statement: it becomes INSERT ... ON CONFLICT (email) DO NOTHING / DO
+    UPDATE. Repeated emails within `rows` are collapsed first (the last one
+    wins), as Postgres refuses to change the same row twice in one statement.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    if not rows:
+        return counts
+    if on_conflict == "error":
+        for start in range(0, len(rows), MAX_INSERT_ROWS):
+            batch = rows[start:start + MAX_INSERT_ROWS]
+            conn.execute(insert(User.__table__).values([dict(zip(COLUMNS, row)) for row in batch]))
+        counts["inserted"] = len(rows)
+        return counts
+
+    candidates = prefilter_emails(list({row[1]: row for row in rows}.values()), on_conflict)
+    if candidates:
+        dialect_insert, inserted = _upsert(conn.dialect.name)
+        for start in range(0, len(candidates), MAX_INSERT_ROWS):
+            batch = candidates[start:start + MAX_INSERT_ROWS]
+            statement = dialect_insert(User.__table__).values([dict(zip(COLUMNS, row)) for row in batch])
+            if on_conflict == "skip":
+                statement = statement.on_conflict_do_nothing(index_elements=["email"])
+            else:
+                statement = statement.on_conflict_do_update(
+                    index_elements=["email"],
+                    set_={column: statement.excluded[column] for column in ("name", "age", "city")}
+                )
+            for (was_inserted,) in conn.execute(statement.returning(inserted)):
+                counts["inserted" if was_inserted else "updated"] += 1
+        remember_emails(candidates, on_conflict)
+    counts["skipped"] = len(rows) - counts["inserted"] - counts["updated"]
+    return counts
+
+def create_users(db: Session, count: int, unique: Optional[str] = None, on_conflict: str = "skip") -> dict:
+    """Insert `count` generated users and commit; returns write_users' counts"""
+    try:
+        counts = write_users(db.connection(), list(generate_users(count, unique)), on_conflict)
+        db.commit()
+        return counts
+    except Exception:
+        db.rollback()
+        raise
+
+def filter_users(
+    query,
+    name: Optional[str] = None,
+    city: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None
+):
+    """Apply the GET /users filters to a query or select()"""
+    if name:
+        query = query.filter(User.name.ilike(f"%{name}%"))
+    if city:
+        query = query.filter(User.city.ilike(f"%{city}%"))
+    if min_age is not None:
+        query = query.filter(User.age >= min_age)
+    if max_age is not None:
+        query = query.filter(User.age <= max_age)
+    return query
+
+# Columns a client can ask for with GET /users?fields=
+USER_FIELDS = tuple(User.__table__.columns.keys())
+
+def parse_fields(fields: Optional[str] = None) -> Tuple[str, ...]:
+    """Validate a comma-separated `fields` value against the User columns.
+
+    Returns the columns in model order; id is always included because the
+    keyset cursor needs it. Raises ValueError for unknown names.
+    """
+    if not fields:
+        return USER_FIELDS
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = sorted(requested.difference(USER_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(field for field in USER_FIELDS if field == "id" or field in requested)
+
+def select_fields(fields: Tuple[str, ...] = USER_FIELDS):
+    """select() of the given User columns"""
+    return select(*(getattr(User, field) for field in fields))
+
+def query_users(
+    db: Session,
+    name: Optional[str] = None,
+    city: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    fields: Tuple[str, ...] = USER_FIELDS
+) -> Tuple[List[Row], Optional[int]]:
+    """Return one keyset page of matching users and the id to resume after.
+
+    Pages are ordered by primary key and start strictly after `after_id`, so
+    each page is a bounded index range scan no matter how deep it is. The
+    second value is None on the last page. Rows are plain column tuples of
+    `fields` (see parse_fields); no ORM objects are built for a read.
+    """
+    stmt = filter_users(select_fields(fields), name, city, min_age, max_age)
+    if after_id is not None:
+        stmt = stmt.where(User.id > after_id)
+
+    # Fetch one extra row to know whether another page exists
+    users = db.execute(stmt.order_by(User.id).limit(limit + 1)).all()
+    if len(users) > limit:
+        users = users[:limit]
+        return users, users[-1].id
+    return users, None
+
+def user_stats(
+    db: Session,
+    name: Optional[str] = None,
+    city: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    bucket_size: int = 10,
+    city_limit: int = 100
+) -> dict:
+    """Aggregate the users matching the GET /users filters in the database.
+
+    Three GROUP BY queries: overall count and age range, per-city counts (the
+    `city_limit` largest cities) and an age histogram in `bucket_size` steps.
+    Only the aggregates leave the database, never the rows. On PostgreSQL the
+    queries share one REPEATABLE READ snapshot, so the city and bucket counts
+    add up to the total under concurrent writes; SQLite is serializable anyway.
+    """
+    def filtered(stmt):
+        return filter_users(stmt, name, city, min_age, max_age)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Must be the first statement of the session's transaction
+        db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"))
+
+    total = db.execute(filtered(select(
+        func.count(User.id), func.min(User.age), func.max(User.age), func.avg(User.age)
+    ))).one()
+
+    city_count = func.count(User.id).label("count")
+    cities = db.execute(
+        filtered(select(User.city, city_count))
+        .group_by(User.city)
+        .order_by(city_count.desc(), User.city)
+        .limit(city_limit)
+    ).all()
+
+    bucket = ((User.age // bucket_size) * bucket_size).label("bucket")
+    buckets = db.execute(
+        filtered(select(bucket, func.count(User.id)))
+        .where(User.age.is_not(None))
+        .group_by(bucket)
+        .order_by(bucket)
+    ).all()
+
+    return {
+        "count": total[0],
+        "min_age": total[1],
+        "max_age": total[2],
+        "avg_age": round(float(total[3]), 2) if total[3] is not None else None,
+        "cities": [{"city": city_name, "count": count} for city_name, count in cities],
+        "age_buckets": [
+            {"min_age": start, "max_age": start + bucket_size - 1, "count": count}
+            for start, count in buckets
+        ]
+    }
+
+def _delete_returning(db: Session, condition) -> int:
+    """Run one DELETE ... RETURNING id and commit; returns the rows removed"""
+    try:
+        stmt = delete(User).where(condition).returning(User.id)
+        deleted = len(db.execute(stmt, execution_options={"synchronize_session": False}).all())
+        db.commit()
+        # Deleted emails can be inserted again; the filter would skip them
+        if deleted:
+            forget_emails()
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+
+def delete_user(db: Session, user_id: int) -> bool:
+    """Delete a user in one statement; False if no such user"""
+    return _delete_returning(db, User.id == user_id) > 0
+
+def delete_users(
+    db: Session,
+    ids: Optional[Iterable[int]] = None,
+    name: Optional[str] = None,
+    city: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    batch_size: int = DELETE_BATCH_SIZE
+) -> int:
+    """Delete users by id, or all users matching the GET /users filters.
+
+    Each batch is one DELETE ... RETURNING id of at most `batch_size` rows,
+    committed on its own, so locks and WAL per transaction stay bounded and
+    a failure keeps the batches already done. Returns the rows deleted.
+    """
+    deleted = 0
+    if ids is not None:
+        ids = sorted(set(ids))
+        for start in range(0, len(ids), batch_size):
+            deleted += _delete_returning(db, User.id.in_(ids[start:start + batch_size]))
+        return deleted
+
+    # Each pass removes the lowest `batch_size` matching ids until none are left;
+    # a short batch does not mean the end, a concurrent delete may have shrunk it
+    batch = filter_users(select(User.id), name, city, min_age, max_age).order_by(User.id).limit(batch_size)
+    while True:
+        removed = _delete_returning(db, User.id.in_(batch))
+        if not removed:
+            return deleted
+        deleted += removed
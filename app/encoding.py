@@ -0,0 +1,30 @@
+from typing import Iterable
+
+import orjson
+
+def dumps(obj) -> bytes:
+    """Compact UTF-8 JSON bytes.
+
+    Always orjson: the bytes end up in content-addressed S3 keys, which must
+    not depend on which encoder a process happened to have.
+    """
+    return orjson.dumps(obj, default=str)
+
+class EncodedRows(list):
+    """Result rows as plain dicts, each JSON-encoded exactly once.
+
+    Behaves like the list of dicts it contains, so anything expecting
+    serialized results keeps working, while the HTTP response and the S3
+    archive splice together the same pre-encoded bytes instead of encoding
+    the rows again.
+    """
+
+    def __init__(self, rows: Iterable):
+        super().__init__(row._asdict() for row in rows)
+        self.encoded = [dumps(row) for row in self]
+
+    def json_array(self) -> bytes:
+        return b'[' + b','.join(self.encoded) + b']'
+
+    def ndjson(self) -> bytes:
+        return b''.join(row + b'\n' for row in self.encoded)
@@ -0,0 +1,75 @@
+"""Gunicorn settings for the production server (the container's CMD):
+
+    gunicorn app.main:app --config app/gunicorn_conf.py
+
+Starts one uvicorn worker per CPU of the container's cgroup quota, imports the
+app once in the master before forking (preload), recycles each worker after
+GUNICORN_MAX_REQUESTS requests and gives in-flight requests
+GUNICORN_GRACEFUL_TIMEOUT seconds to finish on SIGTERM. Every setting can be
+overridden on the command line.
+"""
+import glob
+import os
+import tempfile
+
+from app.workers import cpu_limit, pool_size_per_worker, worker_count
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = worker_count(cpu_limit())
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Restart a worker after this many requests (0 never does), spread by the
+# jitter so that the workers do not all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10))
+# Below the pod's terminationGracePeriodSeconds (30 by default), so that
+# workers finish their requests before Kubernetes sends SIGKILL
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 25))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+accesslog = "-"
+
+# Split the pod's connection budget between the workers, and within each worker
+# between the sync and async engines (DATABASE_ASYNC=true keeps both pools);
+# this runs before the app (and so app.pool_config) is imported
+max_connections = os.getenv("DATABASE_MAX_CONNECTIONS")
+if max_connections and "DATABASE_POOL_SIZE" not in os.environ:
+    engines = 2 if os.getenv("DATABASE_ASYNC", "false").lower() == "true" else 1
+    os.environ["DATABASE_POOL_SIZE"] = str(pool_size_per_worker(int(max_connections), workers, engines))
+    os.environ.setdefault("DATABASE_MAX_OVERFLOW", "0")
+
+# /metrics aggregates the workers through files in PROMETHEUS_MULTIPROC_DIR,
+# which must be empty when the server starts
+if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+def on_starting(server):
+    """Create the schema once in the master instead of racing in every worker"""
+    if not server.cfg.preload_app:
+        return
+    from app.database import engine
+    from app.main import CREATE_TABLES, create_tables
+    if CREATE_TABLES:
+        create_tables()
+    # Connections opened here must not be shared with the forked workers
+    engine.dispose()
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())
+
+def post_fork(server, worker):
+    """Give each worker its own connections; pools are inherited from the master on fork"""
+    from app.database import engine, read_engines
+    for forked in [engine, *read_engines]:
+        forked.dispose(close=False)
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited (recycled or crashed)"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,39 +1,66 @@
 import os
 import sys
-import random
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
-import json
+from contextlib import asynccontextmanager
+import asyncio
 
 # Smart import system that works in all environments
 try:
     # First try relative imports (works in Docker)
-    from .database import SessionLocal, engine, create_tables
-    from .models import Base, User
-    from .schemas import UserCreate, UserResponse, UserQueryResponse
-    from .s3_utils import S3Handler
+    from .database import create_tables, USE_ASYNC_DB, async_engine, get_sync_db, get_async_db, run_in_session, run_read_only, replicas, async_read_engines
+    from .schemas import UserCreate, UserResponse, UserQueryResponse, UserStatsResponse
+    from .s3_utils import S3Handler, run_s3
+    from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+    from .streaming import NDJSON_MEDIA_TYPE, stream_users, stream_users_async
+    from .bulk_load import BULK_CHUNK_SIZE, BULK_MAX_COUNT, GENERATOR_WORKERS, bulk_load_users
+    from .query_cache import QueryCache
+    from .encoding import EncodedRows, dumps
+    from .metrics import MetricsMiddleware, USERS_ROWS_RETURNED, render_metrics
+    from .profiler import (
+        PROFILE_HEADER, PROFILER_MAX_SECONDS, PROFILER_TOKEN, ProfilerMiddleware, SamplingProfiler, profile_name, save_profile, token_matches
+    )
+    from . import crud
 except (ImportError, ValueError):
     try:
         # Then try absolute imports with 'app' prefix (works in tests)
-        from app.database import SessionLocal, engine, create_tables
-        from app.models import Base, User
-        from app.schemas import UserCreate, UserResponse, UserQueryResponse
-        from app.s3_utils import S3Handler
+        from app.database import create_tables, USE_ASYNC_DB, async_engine, get_sync_db, get_async_db, run_in_session, run_read_only, replicas, async_read_engines
+        from app.schemas import UserCreate, UserResponse, UserQueryResponse, UserStatsResponse
+        from app.s3_utils import S3Handler, run_s3
+        from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+        from app.streaming import NDJSON_MEDIA_TYPE, stream_users, stream_users_async
+        from app.bulk_load import BULK_CHUNK_SIZE, BULK_MAX_COUNT, GENERATOR_WORKERS, bulk_load_users
+        from app.query_cache import QueryCache
+        from app.encoding import EncodedRows, dumps
+        from app.metrics import MetricsMiddleware, USERS_ROWS_RETURNED, render_metrics
+        from app.profiler import (
+            PROFILE_HEADER, PROFILER_MAX_SECONDS, PROFILER_TOKEN, ProfilerMiddleware, SamplingProfiler, profile_name, save_profile, token_matches
+        )
+        from app import crud
     except ImportError:
         # Finally try direct imports (works in Lambda)
-        from database import SessionLocal, engine, create_tables
-        from models import Base, User
-        from schemas import UserCreate, UserResponse, UserQueryResponse
-        from s3_utils import S3Handler
+        from database import create_tables, USE_ASYNC_DB, async_engine, get_sync_db, get_async_db, run_in_session, run_read_only, replicas, async_read_engines
+        from schemas import UserCreate, UserResponse, UserQueryResponse, UserStatsResponse
+        from s3_utils import S3Handler, run_s3
+        from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+        from streaming import NDJSON_MEDIA_TYPE, stream_users, stream_users_async
+        from bulk_load import BULK_CHUNK_SIZE, BULK_MAX_COUNT, GENERATOR_WORKERS, bulk_load_users
+        from query_cache import QueryCache
+        from encoding import EncodedRows, dumps
+        from metrics import MetricsMiddleware, USERS_ROWS_RETURNED, render_metrics
+        from profiler import (
+            PROFILE_HEADER, PROFILER_MAX_SECONDS, PROFILER_TOKEN, ProfilerMiddleware, SamplingProfiler, profile_name, save_profile, token_matches
+        )
+        import crud
 
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Header
+from fastapi.responses import Response, StreamingResponse
 from mangum import Mangum
+from mangum.adapter import DEFAULT_TEXT_MIME_TYPES
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from faker import Faker
 from aws_lambda_powertools import Logger, Tracer
-from aws_lambda_powertools.event_handler import APIGatewayRestResolver
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_xray_sdk.core import patch_all
 
 # Initialize AWS Lambda Powertools
 logger = Logger()
@@ -41,157 +68,369 @@ tracer = Tracer()
 
 # Only patch AWS SDK if running in Lambda environment
 if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+    from aws_xray_sdk.core import patch_all
     patch_all()
 
-# Create database tables
-create_tables()
+# Schema creation needs a database round trip, so it runs on startup (or on
+# the first Lambda invocation) instead of at import. Disable it where the
+# schema is managed by the deployment.
+CREATE_TABLES = os.getenv("DATABASE_CREATE_TABLES", "true").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if CREATE_TABLES:
+        await run_in_threadpool(create_tables)
+    yield
+    # Drain queued S3 archives before the worker exits
+    await run_in_threadpool(s3_handler.close)
+    if async_engine is not None:
+        await async_engine.dispose()
+    for async_read_engine in async_read_engines:
+        await async_read_engine.dispose()
 
 # Configure FastAPI app with environment-specific settings
 app = FastAPI(
     title="User Management API",
+    lifespan=lifespan,
     root_path=os.getenv("API_GATEWAY_BASE_PATH", ""),  # Used by API Gateway in Lambda
     openapi_prefix=os.getenv("API_GATEWAY_BASE_PATH", "")  # Ensures OpenAPI docs work in both environments
 )
+app.add_middleware(MetricsMiddleware)
 
 # Detect if we're running in a test environment
 IN_PYTEST = 'pytest' in sys.modules
 TESTING = IN_PYTEST or os.getenv('PYTEST_CURRENT_TEST') == 'True' or os.getenv('ENVIRONMENT') == 'test'
 
-fake = Faker()
 s3_handler = S3Handler(testing=TESTING)
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Requests carrying the profile header are profiled; not installed at all
+# unless PROFILER_TOKEN is set
+if PROFILER_TOKEN:
+    app.add_middleware(ProfilerMiddleware, s3_handler=s3_handler)
+
+# Optional in-process cache of GET /users results (disabled when the TTL is 0)
+USERS_CACHE_TTL_SECONDS = float(os.getenv("USERS_CACHE_TTL_SECONDS", 0))
+users_cache = QueryCache(
+    max_entries=int(os.getenv("USERS_CACHE_MAX_ENTRIES", 256)),
+    ttl_seconds=USERS_CACHE_TTL_SECONDS
+) if USERS_CACHE_TTL_SECONDS > 0 else None
+
+def users_response(users: EncodedRows, s3_file: str, next_cursor: Optional[str]) -> Response:
+    """UserQueryResponse body assembled from the rows' pre-encoded JSON"""
+    USERS_ROWS_RETURNED.labels("page").observe(len(users))
+    body = b''.join((
+        b'{"users":', users.json_array(),
+        b',"count":', str(len(users)).encode(),
+        b',"s3_file":', dumps(s3_file),
+        b',"timestamp":', dumps(datetime.utcnow().isoformat()),
+        b',"next_cursor":', dumps(next_cursor),
+        b'}'
+    ))
+    return Response(content=body, media_type="application/json")
+
+def invalidate_users_cache():
+    """Drop cached GET /users results after a write to the users table"""
+    if users_cache is not None:
+        users_cache.invalidate()
+
+# Dependency: AsyncSession when DATABASE_ASYNC=true, otherwise a sync Session
+get_db = get_async_db if USE_ASYNC_DB else get_sync_db
+
+def read_your_writes(x_read_your_writes: Optional[str] = Header(default=None)) -> bool:
+    """True when the client asks to read from the primary (and bypass the cache)"""
+    return x_read_your_writes is not None and x_read_your_writes.lower() in ("1", "true", "yes")
 
 @app.get("/healthcheck")
 @tracer.capture_method
 async def healthcheck():
     environment = "AWS Lambda" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "Docker"
     logger.info("Health check requested")
-    return {
+    response = {
         "status": "healthy",
         "timestamp": datetime.utcnow(),
         "environment": environment
     }
+    if s3_handler.writer is not None:
+        response["s3_writer"] = s3_handler.writer.stats()
+    if s3_handler.bundler is not None:
+        response["s3_bundler"] = s3_handler.bundler.stats()
+    if users_cache is not None:
+        response["users_cache"] = users_cache.stats()
+    if replicas is not None:
+        response["read_replicas"] = replicas.stats()
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.post("/admin/profile", include_in_schema=False)
+async def profile_process(
+    seconds: float = Query(default=10, gt=0, le=PROFILER_MAX_SECONDS),
+    token: Optional[str] = Header(default=None, alias=PROFILE_HEADER)
+):
+    """Sample every thread of this process for `seconds` and save the collapsed stacks"""
+    if not PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token_matches(token):
+        raise HTTPException(status_code=403, detail="Invalid profiler token")
+
+    logger.info(f"Profiling for {seconds}s")
+    profiler = SamplingProfiler().start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    location = await run_in_threadpool(save_profile, profile_name("process"), profiler, s3_handler)
+    return {"location": location, "samples": profiler.samples, "duration": round(profiler.duration, 3)}
 
 @app.post("/populate")
 @tracer.capture_method
-async def populate_data(count: int = Query(default=10, ge=1, le=100), unique: str = None, db: Session = Depends(get_db)):
+async def populate_data(
+    count: int = Query(default=10, ge=1, le=100),
+    unique: str = None,
+    on_conflict: Literal["error", "skip", "update"] = "skip",
+    db: Session = Depends(get_db)
+):
     logger.info(f"Populating database with {count} users")
-    users = []
     
     try:
-        for i in range(count):
-            # Use the unique parameter to generate unique email addresses if provided
-            email_suffix = f"-{unique}-{i}" if unique else ""
-            email = fake.email().replace("@", f"{email_suffix}@")
-            
-            user = User(
-                name=fake.name(),
-                email=email,
-                age=random.randint(18, 80),
-                city=fake.city()
-            )
-            db.add(user)
-            users.append(user)
-        
-        db.commit()
-        logger.info(f"Successfully created {count} users")
-        return {"message": f"Created {count} users"}
+        counts = await run_in_session(db, crud.create_users, count, unique, on_conflict)
+        invalidate_users_cache()
+        logger.info(f"Successfully created {counts['inserted']} users ({counts['skipped']} skipped, {counts['updated']} updated)")
+        return {"message": f"Created {counts['inserted']} users", **counts}
     except Exception as e:
         logger.error(f"Error populating database: {str(e)}")
-        db.rollback()
+        raise HTTPException(status_code=500, detail="Error populating database")
+
+@app.post("/populate/bulk")
+@tracer.capture_method
+async def populate_bulk(
+    count: int = Query(default=10000, ge=1, le=BULK_MAX_COUNT),
+    unique: str = None,
+    chunk_size: int = Query(default=BULK_CHUNK_SIZE, ge=1, le=100000),
+    method: Literal["auto", "copy", "insert"] = "auto",
+    seed: Optional[int] = None,
+    workers: int = Query(default=GENERATOR_WORKERS, ge=1, le=32),
+    on_conflict: Literal["error", "skip", "update"] = "skip"
+):
+    logger.info(f"Bulk populating database with {count} users in chunks of {chunk_size}")
+    
+    try:
+        stats = await run_in_threadpool(
+            bulk_load_users, count, unique, chunk_size, method, seed, workers, on_conflict
+        )
+        invalidate_users_cache()
+        return {"message": f"Created {stats['rows']} users", **stats}
+    except ValueError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        # Chunks committed before the failure are visible, so drop cached results too
+        invalidate_users_cache()
+        logger.error(f"Error bulk populating database: {str(e)}")
         raise HTTPException(status_code=500, detail="Error populating database")
 
 @app.get("/users", response_model=UserQueryResponse)
 @tracer.capture_method
 async def get_users(
+    request: Request,
     name: Optional[str] = None,
     city: Optional[str] = None,
     min_age: Optional[int] = None,
     max_age: Optional[int] = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(default=None, description="Comma-separated columns to return, e.g. id,email"),
+    primary: bool = Depends(read_your_writes)
 ):
-    logger.info(f"Fetching users with filters: name={name}, city={city}, min_age={min_age}, max_age={max_age}")
-    query = db.query(User)
-    
-    if name:
-        query = query.filter(User.name.ilike(f"%{name}%"))
-    if city:
-        query = query.filter(User.city.ilike(f"%{city}%"))
-    if min_age is not None:
-        query = query.filter(User.age >= min_age)
-    if max_age is not None:
-        query = query.filter(User.age <= max_age)
-    
+    logger.info(f"Fetching users with filters: name={name}, city={city}, min_age={min_age}, max_age={max_age}, limit={limit}, cursor={cursor}, fields={fields}")
+    try:
+        after_id = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     try:
-        users = query.all()
+        columns = crud.parse_fields(fields)
+    except ValueError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    projection = list(columns) if fields else None
+
+    # Clients asking for NDJSON get every matching row (from the cursor on)
+    # streamed through a server-side cursor instead of a single page
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        filters = {"name": name, "city": city, "min_age": min_age, "max_age": max_age}
+        archive = s3_handler.open_archive_stream(
+            {**filters, "limit": None, "cursor": cursor, "fields": projection}
+        )
+        stream = stream_users_async if USE_ASYNC_DB else stream_users
+        logger.info(f"Streaming users to {archive.key}")
+        return StreamingResponse(
+            stream(filters, after_id, archive, columns, primary),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"X-S3-File": archive.key}
+        )
+
+    # Repeated filter combinations skip both the query and the S3 upload
+    cache = None if primary else users_cache
+    if cache is not None:
+        cache_key = QueryCache.make_key(name, city, min_age, max_age, limit, after_id, columns)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving users from cache")
+            return users_response(**cached)
+        cache_version = cache.version
+
+    try:
+        users, next_id = await run_read_only(
+            crud.query_users, name, city, min_age, max_age, limit, after_id, columns, primary=primary
+        )
+        next_cursor = encode_cursor(next_id) if next_id is not None else None
         logger.info(f"Found {len(users)} users matching the criteria")
         
-        # Create clean dictionaries that can be serialized to JSON
-        serialized_users = []
-        for user in users:
-            serialized_users.append({
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "age": user.age,
-                "city": user.city
-            })
+        # Encode each row once; the same bytes go to S3 and into the response
+        serialized_users = EncodedRows(users)
         
         # Store query results in S3
         query_params = {
             "name": name,
             "city": city,
             "min_age": min_age,
-            "max_age": max_age
+            "max_age": max_age,
+            "limit": limit,
+            "cursor": cursor,
+            "fields": projection
         }
-        s3_file = s3_handler.store_query_result(query_params, serialized_users)
+        s3_file = await run_s3(s3_handler.store_query_result, query_params, serialized_users)
         
-        return UserQueryResponse(
-            users=users,
-            count=len(users),
-            s3_file=s3_file,
-            timestamp=datetime.utcnow()
-        )
+        if cache is not None:
+            cache.put(cache_key, {
+                "users": serialized_users,
+                "s3_file": s3_file,
+                "next_cursor": next_cursor
+            }, cache_version)
+        
+        return users_response(serialized_users, s3_file, next_cursor)
     except Exception as e:
         logger.error(f"Error fetching users: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching users")
 
+@app.get("/users/stats", response_model=UserStatsResponse)
+@tracer.capture_method
+async def get_user_stats(
+    name: Optional[str] = None,
+    city: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    bucket_size: int = Query(default=10, ge=1, le=100),
+    city_limit: int = Query(default=100, ge=1, le=1000),
+    archive: bool = False,
+    primary: bool = Depends(read_your_writes)
+):
+    logger.info(f"Aggregating users with filters: name={name}, city={city}, min_age={min_age}, max_age={max_age}")
+
+    cache = None if primary else users_cache
+    if cache is not None:
+        cache_key = QueryCache.make_key(name, city, min_age, max_age, "stats", bucket_size, city_limit, archive)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving user stats from cache")
+            return UserStatsResponse(**cached, timestamp=datetime.utcnow())
+        cache_version = cache.version
+
+    try:
+        stats = await run_read_only(
+            crud.user_stats, name, city, min_age, max_age, bucket_size, city_limit, primary=primary
+        )
+        if archive:
+            query_params = {
+                "name": name,
+                "city": city,
+                "min_age": min_age,
+                "max_age": max_age,
+                "aggregate": "stats",
+                "bucket_size": bucket_size,
+                "city_limit": city_limit
+            }
+            stats["s3_file"] = await run_s3(s3_handler.store_query_result, query_params, [stats])
+
+        if cache is not None:
+            cache.put(cache_key, stats, cache_version)
+        return UserStatsResponse(**stats, timestamp=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Error aggregating users: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error aggregating users")
+
+@app.delete("/users")
+@tracer.capture_method
+async def delete_users(
+    ids: Optional[List[int]] = Query(default=None),
+    name: Optional[str] = None,
+    city: Optional[str] = None,
+    min_age: Optional[int] = None,
+    max_age: Optional[int] = None,
+    batch_size: int = Query(default=crud.DELETE_BATCH_SIZE, ge=1, le=100000),
+    db: Session = Depends(get_db)
+):
+    has_filters = bool(name or city) or min_age is not None or max_age is not None
+    if ids and has_filters:
+        raise HTTPException(status_code=400, detail="Pass either ids or filters, not both")
+    if not ids and not has_filters:
+        # An empty filter set would match every user
+        raise HTTPException(status_code=400, detail="Pass ids or at least one filter")
+    logger.info(f"Bulk deleting users: ids={len(ids) if ids else 0}, name={name}, city={city}, min_age={min_age}, max_age={max_age}")
+    
+    try:
+        deleted = await run_in_session(
+            db, crud.delete_users, ids or None, name, city, min_age, max_age, batch_size
+        )
+    except Exception as e:
+        # Batches committed before the failure are gone, so drop cached results too
+        invalidate_users_cache()
+        logger.error(f"Error bulk deleting users: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error deleting users")
+    
+    invalidate_users_cache()
+    logger.info(f"Successfully deleted {deleted} users")
+    return {"message": f"Deleted {deleted} users", "deleted": deleted}
+
 @app.delete("/users/{user_id}")
 @tracer.capture_method
 async def delete_user(user_id: int, db: Session = Depends(get_db)):
     logger.info(f"Attempting to delete user {user_id}")
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        logger.warning(f"User {user_id} not found")
-        raise HTTPException(status_code=404, detail="User not found")
-    
     try:
-        db.delete(user)
-        db.commit()
-        logger.info(f"Successfully deleted user {user_id}")
-        return {"message": f"User {user_id} deleted"}
+        deleted = await run_in_session(db, crud.delete_user, user_id)
     except Exception as e:
         logger.error(f"Error deleting user {user_id}: {str(e)}")
-        db.rollback()
         raise HTTPException(status_code=500, detail="Error deleting user")
+    
+    if not deleted:
+        logger.warning(f"User {user_id} not found")
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    invalidate_users_cache()
+    logger.info(f"Successfully deleted user {user_id}")
+    return {"message": f"User {user_id} deleted"}
+
+# Mangum handler with parameters supported in v0.17.0, built once per
+# execution environment and reused by every invocation
+asgi_handler = Mangum(
+    app, 
+    api_gateway_base_path=os.getenv("API_GATEWAY_BASE_PATH", "/"),
+    lifespan="off",
+    # Return NDJSON exports as text instead of base64
+    text_mime_types=[*DEFAULT_TEXT_MIME_TYPES, NDJSON_MEDIA_TYPE]
+)
 
 # Update the Lambda handler to use compatible Mangum parameters
 @logger.inject_lambda_context
 @tracer.capture_lambda_handler
 def lambda_handler(event: dict, context: LambdaContext) -> dict:
-    # Initialize Mangum handler with parameters supported in v0.17.0
-    asgi_handler = Mangum(
-        app, 
-        api_gateway_base_path=os.getenv("API_GATEWAY_BASE_PATH", "/"),
-        lifespan="off"
-    )
+    # Lifespan is off under Mangum; create_tables only does work the first time
+    if CREATE_TABLES:
+        create_tables()
     # Handle the event
     return asgi_handler(event, context)
 
@@ -202,5 +441,6 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8000)),
-        reload=os.getenv("ENVIRONMENT", "development") == "development"
+        # Production runs gunicorn (app/gunicorn_conf.py); the reloader is opt-in
+        reload=os.getenv("ENVIRONMENT") == "development"
     )
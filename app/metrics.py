@@ -0,0 +1,148 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# With several uvicorn/gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an
+# empty directory shared by the workers (before they start) so /metrics
+# aggregates all of them instead of reporting whichever worker answered.
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body chunk is sent",
+    ["method", "route", "status"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Time spent executing SQL statements", ["operation"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30)
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts", "Checkouts that gave up after pool_timeout because the pool was exhausted"
+)
+# Gauges are summed over the live worker processes in multiprocess mode, so
+# checked_out / capacity is the utilization of the whole pod
+POOL_CAPACITY = Gauge(
+    "db_pool_capacity", "Connections the pool may open (pool_size + max_overflow)", ["engine"],
+    multiprocess_mode="livesum"
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool", ["engine"],
+    multiprocess_mode="livesum"
+)
+S3_REQUEST_DURATION = Histogram(
+    "s3_request_duration_seconds", "Latency of S3 calls made for query archives", ["operation"]
+)
+S3_UPLOADED_BYTES = Counter(
+    "s3_uploaded_bytes", "Bytes uploaded to the query bucket", ["operation"]
+)
+USERS_ROWS_RETURNED = Histogram(
+    "users_rows_returned", "Rows returned per GET /users call", ["mode"],
+    buckets=(0, 1, 10, 50, 100, 250, 500, 1000, 10000, 100000, 1000000, 10000000)
+)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY"}
+
+def render_metrics():
+    """Return the exposition body and its content type"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+class MetricsMiddleware:
+    """ASGI middleware recording REQUEST_DURATION per route template and status.
+
+    The route template (e.g. /users/{user_id}) comes from the matched FastAPI
+    route, so ids in paths do not create new label values. Streaming responses
+    are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - start)
+
+class _TimedCheckout:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """QueuePool that records how long each checkout waited"""
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited"""
+
+def instrument_engine(engine, name="primary"):
+    """Record DB_QUERY_DURATION for every statement run through a sync Engine,
+    and the pool gauges (labelled `name`) for queue pools"""
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        # A negative max_overflow means no limit
+        overflow = pool._max_overflow
+        capacity = pool.size() + overflow if overflow >= 0 else float("inf")
+
+        # Set from the process that opens connections: with a preloaded app,
+        # values set in the master before fork do not reach the workers
+        @event.listens_for(engine, "connect")
+        def _connected(dbapi_connection, connection_record):
+            POOL_CAPACITY.labels(name).set(capacity)
+
+        @event.listens_for(engine, "checkout")
+        def _checked_out(dbapi_connection, connection_record, connection_proxy):
+            POOL_CHECKED_OUT.labels(name).inc()
+
+        @event.listens_for(engine, "checkin")
+        def _checked_in(dbapi_connection, connection_record):
+            POOL_CHECKED_OUT.labels(name).dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        words = statement[:32].split(None, 1)
+        operation = words[0].upper() if words else "OTHER"
+        DB_QUERY_DURATION.labels(operation if operation in SQL_OPERATIONS else "OTHER").observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _drop_timer(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
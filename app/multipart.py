@@ -0,0 +1,154 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_lambda_powertools import Logger
+
+# Smart import system that works in all environments
+try:
+    # First try relative imports (works in Docker)
+    from .metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
+except (ImportError, ValueError):
+    try:
+        # Then try absolute imports with 'app' prefix (works in tests)
+        from app.metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
+    except ImportError:
+        # Finally try direct imports (works in Lambda)
+        from metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
+
+logger = Logger()
+
+# S3 rejects parts under 5 MiB, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = max(MIN_PART_SIZE, int(os.getenv('S3_MULTIPART_PART_SIZE', 8 * 1024 * 1024)))
+# Archives larger than one part are uploaded in parts
+MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', PART_SIZE))
+CONCURRENCY = int(os.getenv('S3_MULTIPART_CONCURRENCY', 4))
+
+class PartBody(io.RawIOBase):
+    """Seekable, read-only file over a memoryview, so a part sliced out of a
+    larger body is sent without copying it (botocore rejects bare memoryviews)"""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self._view) - self._position)
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+class MultipartUpload:
+    """S3 multipart upload fed incrementally with write().
+
+    Each full part is uploaded from a thread pool as soon as it is complete.
+    At most `concurrency` parts are in flight (write() blocks for a free slot),
+    so memory stays around (concurrency + 1) * part_size whatever the object
+    size. Any failure aborts the upload so no orphaned parts are left behind.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=PART_SIZE, concurrency=CONCURRENCY, **put_args):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.bytes = 0
+        response = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **put_args)
+        self.upload_id = response['UploadId']
+        self._pool = ThreadPoolExecutor(concurrency, thread_name_prefix='s3-multipart')
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._futures = []
+        self._buffer = bytearray()
+        self._closed = False
+
+    def write(self, data):
+        """Append bytes, uploading every part that fills up"""
+        self._buffer += data
+        self.bytes += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(part)
+
+    def write_body(self, body):
+        """Upload a complete in-memory body as parts sliced out of it.
+
+        Unlike write(), nothing is copied into the part buffer, so the peak
+        stays at the body plus the parts in flight rather than twice the body.
+        """
+        view = memoryview(body)
+        self.bytes += len(view)
+        for start in range(0, len(view), self.part_size):
+            self._submit(PartBody(view[start:start + self.part_size]))
+
+    def flush(self):
+        """Parts are sent as they fill up; present for file-like wrappers"""
+
+    def _submit(self, data):
+        self._raise_failed()
+        self._slots.acquire()
+        future = self._pool.submit(self._upload_part, len(self._futures) + 1, data)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _raise_failed(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def _upload_part(self, number, data):
+        with S3_REQUEST_DURATION.labels("upload_part").time():
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data
+            )
+        S3_UPLOADED_BYTES.labels("upload_part").inc(len(data))
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def complete(self):
+        """Upload the remaining bytes as the last part and assemble the object"""
+        try:
+            if self._buffer or not self._futures:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            parts = [future.result() for future in self._futures]
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.abort()
+            raise
+        self._closed = True
+        self._pool.shutdown()
+        logger.info(f"Completed multipart upload of {self.key}: {len(parts)} parts, {self.bytes} bytes")
+
+    def abort(self):
+        """Stop uploading and discard the parts already sent"""
+        if self._closed:
+            return
+        self._closed = True
+        self._buffer = bytearray()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            logger.warning(f"Aborted multipart upload of {self.key}")
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload of {self.key}: {str(e)}")
@@ -0,0 +1,23 @@
+import base64
+import json
+import os
+
+# Page size for GET /users; the limit caps how much a single request can load
+DEFAULT_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", 1000))
+
+def encode_cursor(last_id: int) -> str:
+    """Build the opaque cursor that resumes after `last_id`"""
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """Return the last seen id from a cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))["id"]
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(last_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return last_id
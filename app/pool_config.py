@@ -0,0 +1,49 @@
+import os
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+# Connection pooling by runtime (DATABASE_POOL):
+#   queue   up to DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW connections per
+#           process; the default for uvicorn workers on EKS. Size it so that
+#           replicas x workers x (size + overflow) stays under max_connections.
+#   single  one connection per process, kept between requests; the default in
+#           Lambda, where an execution environment serves one request at a time
+#   null    a new connection for every checkout, for Lambda behind RDS Proxy
+POOL_MODES = ("queue", "single", "null")
+IN_LAMBDA = bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+POOL_MODE = os.getenv("DATABASE_POOL", "single" if IN_LAMBDA else "queue").lower()
+if POOL_MODE not in POOL_MODES:
+    raise ValueError(f"DATABASE_POOL must be one of {', '.join(POOL_MODES)}, not {POOL_MODE!r}")
+
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+# Seconds a request waits for a free connection before failing
+POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+# Replace connections older than this, below the RDS and NAT idle timeouts
+POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))
+# Test each connection on checkout; catches connections dropped while a
+# Lambda environment was frozen or after an RDS failover
+POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+
+def pool_options(url, queue_pool_class, pre_ping=None):
+    """create_engine() pool arguments for `url` under POOL_MODE.
+
+    `queue_pool_class` is the QueuePool class to use (sync or async). Other
+    databases than Postgres (SQLite in local runs) keep their dialect's
+    default pool.
+    """
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    pre_ping = POOL_PRE_PING if pre_ping is None else pre_ping
+    if POOL_MODE == "null":
+        return {"poolclass": NullPool, "pool_pre_ping": pre_ping}
+    size, overflow = (1, 0) if POOL_MODE == "single" else (POOL_SIZE, MAX_OVERFLOW)
+    return {
+        "poolclass": queue_pool_class,
+        "pool_size": size,
+        "max_overflow": overflow,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": pre_ping,
+    }
@@ -0,0 +1,157 @@
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from aws_lambda_powertools import Logger
+from starlette.concurrency import run_in_threadpool
+
+logger = Logger()
+
+# Profiling is off unless a token is configured; without one neither the
+# admin endpoint nor the per-request middleware is active
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", 0.005))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 120))
+# Where profiles go: "local" (PROFILER_DIR) or "s3" (the query bucket)
+PROFILER_OUTPUT = os.getenv("PROFILER_OUTPUT", "local")
+PROFILER_DIR = os.getenv("PROFILER_DIR", "/tmp/profiles")
+PROFILE_HEADER = "x-profile-token"
+
+def token_matches(token):
+    """Constant-time check of a caller's token (raw header bytes or str) against PROFILER_TOKEN"""
+    if not PROFILER_TOKEN or token is None:
+        return False
+    if isinstance(token, str):
+        # Header strings are decoded as latin-1, so this gives back the raw bytes;
+        # compare_digest rejects str arguments with non-ASCII characters
+        try:
+            token = token.encode("latin-1")
+        except UnicodeEncodeError:
+            token = token.encode("utf-8")
+    return hmac.compare_digest(token, PROFILER_TOKEN.encode("utf-8"))
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread's stack from a background thread.
+
+    Every `interval` seconds the current frame of each thread is read with
+    sys._current_frames() and its stack counted, so the profiled code runs
+    unmodified and the cost is the sampler thread alone. The result is in the
+    collapsed format ("thread;outer;...;inner count" per line) read by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.time() - self.started
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                # Leave out the samplers themselves (this one and any concurrent profile)
+                if names.get(ident) == "profiler":
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Stacks in collapsed format, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def profile_name(label):
+    """Unique file name for a profile of `label`"""
+    label = "".join(c if c.isalnum() or c in "-." else "_" for c in label).strip("_")
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{label}-{uuid.uuid4().hex[:8]}.collapsed"
+
+def profile_location(name, s3_handler):
+    """Where save_profile writes the profile called `name`"""
+    if PROFILER_OUTPUT == "s3":
+        return f"s3://{s3_handler.bucket_name}/profiles/{name}"
+    return os.path.join(PROFILER_DIR, name)
+
+def save_profile(name, profiler, s3_handler):
+    """Write a stopped profiler's collapsed stacks to disk or S3; returns the location"""
+    body = profiler.collapsed().encode()
+    location = profile_location(name, s3_handler)
+    if PROFILER_OUTPUT == "s3":
+        s3_handler.put_object(f"profiles/{name}", body, ContentType="text/plain")
+    else:
+        os.makedirs(PROFILER_DIR, exist_ok=True)
+        with open(location, "wb") as f:
+            f.write(body)
+    logger.info(f"Saved profile of {profiler.samples} samples over {profiler.duration:.1f}s to {location}")
+    return location
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling the requests that carry the profile header.
+
+    The header must hold PROFILER_TOKEN. The sampler sees every thread, so
+    requests running at the same time show up in the profile as well. The
+    profile is saved once the response is complete; its location is returned
+    in the X-Profile header.
+    """
+
+    def __init__(self, app, s3_handler):
+        self.app = app
+        self.s3_handler = s3_handler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = dict(scope["headers"]).get(PROFILE_HEADER.encode())
+        if not token_matches(token):
+            await self.app(scope, receive, send)
+            return
+
+        name = profile_name(f"{scope['method']}{scope['path']}")
+        location = profile_location(name, self.s3_handler)
+
+        async def send_with_location(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile", location.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler().start()
+        try:
+            await self.app(scope, receive, send_with_location)
+        finally:
+            profiler.stop()
+            try:
+                await run_in_threadpool(save_profile, name, profiler, self.s3_handler)
+            except Exception as e:
+                logger.error(f"Error saving profile {name}: {str(e)}")
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+class QueryCache:
+    """Bounded LRU cache with a TTL for serialized GET /users results.
+
+    Writes to the users table bump a table version counter. Entries remember
+    the version that was current before their query ran, so a result computed
+    concurrently with a write is never served as fresh. The counter is per
+    process; with several workers or pods the TTL bounds how stale a result
+    can be after a write handled elsewhere.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, version, value)
+        self._lock = threading.Lock()
+        self._version = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(name: Optional[str], city: Optional[str], min_age: Optional[int],
+                 max_age: Optional[int], *extra) -> Tuple:
+        """Normalize the filters; ILIKE is case-insensitive and empty strings are ignored"""
+        return (
+            name.lower() if name else None,
+            city.lower() if city else None,
+            min_age,
+            max_age,
+            *extra
+        )
+
+    @property
+    def version(self) -> int:
+        """Current table version; capture it before running the query"""
+        return self._version
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Return the cached value for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, version, value = entry
+            if version != self._version or expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key: Tuple, value: Any, version: int) -> None:
+        """Store a value computed while `version` was current"""
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self) -> None:
+        """Bump the table version after a write, dropping every cached result"""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+            snapshot["version"] = self._version
+        return snapshot
@@ -0,0 +1,40 @@
+import itertools
+import threading
+import time
+
+class ReplicaSet:
+    """Round-robin rotation over read replicas with temporary ejection.
+
+    Replicas are identified by their index. A replica that fails to hand out
+    a connection is ejected for `eject_seconds` and skipped by candidates()
+    until then, after which it is tried again. When every replica is ejected
+    callers fall back to the primary.
+    """
+
+    def __init__(self, names, eject_seconds=30.0):
+        self.names = list(names)
+        self.eject_seconds = eject_seconds
+        self._counter = itertools.count()
+        self._ejected_until = {}
+        self._lock = threading.Lock()
+        self.ejections = 0
+
+    def candidates(self):
+        """Healthy replica indexes, starting with the next one in rotation"""
+        start = next(self._counter)
+        now = time.monotonic()
+        order = [(start + offset) % len(self.names) for offset in range(len(self.names))]
+        return [index for index in order if self._ejected_until.get(index, 0) <= now]
+
+    def eject(self, index):
+        with self._lock:
+            self._ejected_until[index] = time.monotonic() + self.eject_seconds
+            self.ejections += 1
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "replicas": len(self.names),
+            "healthy": sum(1 for index in range(len(self.names)) if self._ejected_until.get(index, 0) <= now),
+            "ejections": self.ejections
+        }
@@ -1,16 +1,263 @@
-import boto3
+import asyncio
+import contextvars
+import functools
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import uuid
 import os
 from aws_lambda_powertools import Logger
 import sys
 
+# Smart import system that works in all environments
+try:
+    # First try relative imports (works in Docker)
+    from .s3_writer import S3BackgroundWriter
+    from .archive_bundles import ArchiveBundler, read_bundled_archive
+    from .archive_format import ArchiveFormat
+    from .encoding import EncodedRows
+    from .multipart import MULTIPART_THRESHOLD, MultipartUpload
+    from .metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
+except (ImportError, ValueError):
+    try:
+        # Then try absolute imports with 'app' prefix (works in tests)
+        from app.s3_writer import S3BackgroundWriter
+        from app.archive_bundles import ArchiveBundler, read_bundled_archive
+        from app.archive_format import ArchiveFormat
+        from app.encoding import EncodedRows
+        from app.multipart import MULTIPART_THRESHOLD, MultipartUpload
+        from app.metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
+    except ImportError:
+        # Finally try direct imports (works in Lambda)
+        from s3_writer import S3BackgroundWriter
+        from archive_bundles import ArchiveBundler, read_bundled_archive
+        from archive_format import ArchiveFormat
+        from encoding import EncodedRows
+        from multipart import MULTIPART_THRESHOLD, MultipartUpload
+        from metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
+
 logger = Logger()
 
 # Skip S3 operations during test collection
 IN_PYTEST = 'pytest' in sys.modules
 
+# Store identical query results once, under a key derived from their content
+CONTENT_ADDRESSED = os.getenv('S3_CONTENT_ADDRESSED', 'false').lower() == 'true'
+KNOWN_KEYS_MAX = int(os.getenv('S3_KNOWN_KEYS_MAX', 10000))
+# Keep below the bucket's lifecycle expiry, or a key removed by it would still
+# be taken as uploaded and its archive never written again
+KNOWN_KEYS_TTL = float(os.getenv('S3_KNOWN_KEYS_TTL_SECONDS', 3600))
+
+# Seconds close() may spend uploading queued archives on shutdown; keep it
+# below GUNICORN_GRACEFUL_TIMEOUT so workers are not killed mid-flush
+SHUTDOWN_TIMEOUT = float(os.getenv('S3_SHUTDOWN_TIMEOUT', 20))
+
+# Layout of the archives packed into bundles
+JSON_ARCHIVE = ArchiveFormat("json", "none")
+
+# Transport of the S3 client. botocore keeps 10 connections by default, which
+# concurrent requests, background writer threads and multipart parts queue on;
+# the pool is also the number of threads S3 calls are offloaded to
+MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 50))
+CONNECT_TIMEOUT = float(os.getenv('S3_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('S3_READ_TIMEOUT', 30))
+# "adaptive" also slows the client down when S3 answers with throttling errors
+RETRY_MODE = os.getenv('S3_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', 5))
+TCP_KEEPALIVE = os.getenv('S3_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+def client_config():
+    """botocore Config of the S3 client"""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries={'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS},
+        tcp_keepalive=TCP_KEEPALIVE,
+    )
+
+# Threads that run S3 calls for request handlers, one per pooled connection,
+# so uploads neither block the event loop nor take the threads that database
+# calls are offloaded to. Started on first use (after the gunicorn fork).
+_executor = None
+_executor_lock = threading.Lock()
+
+def s3_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(MAX_POOL_CONNECTIONS, thread_name_prefix='s3')
+    return _executor
+
+async def run_s3(fn, *args):
+    """Await a blocking S3 call, e.g. S3Handler.store_query_result, run on the S3 threads"""
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(s3_executor(), call)
+
+def content_key(query_params, results, extension=".json"):
+    """Hash-derived key of a query archive; the timestamp is left out on purpose"""
+    params = json.dumps(query_params, sort_keys=True, separators=(',', ':'), default=str)
+    if isinstance(results, EncodedRows):
+        rows = results.json_array()  # column order is fixed by the query
+    else:
+        rows = json.dumps(results, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    digest = hashlib.sha256(params.encode('utf-8') + b'\n' + rows).hexdigest()
+    return f"queries/sha256/{digest}{extension}"
+
+class KnownKeys:
+    """Bounded, thread-safe LRU set of keys known to exist in the bucket.
+
+    A key is forgotten `ttl` seconds after it was added, hits do not extend
+    it, so a key the bucket has since expired is checked and uploaded again.
+    """
+
+    def __init__(self, max_size=KNOWN_KEYS_MAX, ttl=KNOWN_KEYS_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys = OrderedDict()  # key -> expires_at
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._keys.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._keys[key]
+                return False
+            self._keys.move_to_end(key)
+            return True
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = time.monotonic() + self.ttl
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+class ArchiveSink:
+    """Destination of a streamed archive.
+
+    Bytes are buffered in memory up to the multipart threshold. A small
+    archive is then sent with a single PUT; a larger one switches to a
+    multipart upload that ships each part as soon as it fills up.
+    """
+
+    def __init__(self, handler, key, put_args, upload=True):
+        self.handler = handler
+        self.key = key
+        self.put_args = put_args
+        self.upload = upload
+        self._buffer = bytearray()
+        self._multipart = None
+        self._closed = False
+        self._failed = False
+
+    def write(self, data):
+        # Writes after close/abort come from compressors being garbage collected
+        if self._closed or self._failed or not self.upload:
+            return
+        # An S3 failure loses the archive, never the response being streamed
+        try:
+            if self._multipart is not None:
+                self._multipart.write(data)
+                return
+            self._buffer += data
+            if len(self._buffer) > MULTIPART_THRESHOLD:
+                self._multipart = self.handler.start_multipart_upload(self.key, **self.put_args)
+                self._multipart.write(bytes(self._buffer))
+                self._buffer = bytearray()
+        except Exception as e:
+            self._failed = True
+            self.abort()
+            logger.error(f"Error uploading streamed results to S3, dropping archive {self.key}: {str(e)}")
+
+    def flush(self):
+        pass
+
+    def finish(self, put_args):
+        """Upload whatever is buffered; put_args only apply to single-PUT archives"""
+        self._closed = True
+        if self._failed or not self.upload:
+            return
+        if self._multipart is not None:
+            self._multipart.complete()
+        else:
+            self.handler.put_object(self.key, bytes(self._buffer), **put_args)
+            self._buffer = bytearray()
+
+    def abort(self):
+        self._closed = True
+        self._buffer = bytearray()
+        if self._multipart is not None:
+            self._multipart.abort()
+
+class QueryArchiveStream:
+    """Query archive written row by row while results are streamed to the client.
+
+    Produces the same document as S3Handler.store_query_result, but the body is
+    built, compressed and uploaded incrementally (see ArchiveSink), so memory
+    stays bounded no matter how many rows pass through. Only the json and
+    ndjson layouts can be written this way.
+    """
+
+    def __init__(self, handler, key, query_params, upload=True, archive_format=None):
+        self.handler = handler
+        self.key = key
+        self.upload = upload
+        self.count = 0
+        self.archive_format = archive_format or ArchiveFormat("json", "none")
+        self._ndjson = self.archive_format.format == "ndjson"
+        # The row count is only known at the end, so a multipart upload (whose
+        # metadata is fixed when it starts) goes without result-count
+        self._sink = ArchiveSink(handler, key, self.archive_format.put_args(), upload)
+        self._out = self.archive_format.compressor(self._sink)
+        timestamp = datetime.utcnow().isoformat()
+        if self._ndjson:
+            self._out.write(ArchiveFormat.header(timestamp, query_params).encode('utf-8') + b'\n')
+        else:
+            header = json.dumps({"timestamp": timestamp, "query_parameters": query_params}, default=str)
+            # Leave the object open so the results array can follow
+            self._out.write(header[:-1].encode('utf-8') + b', "results": [')
+
+    def write(self, row):
+        """Append one result row"""
+        self.write_encoded(json.dumps(row, default=str).encode('utf-8'))
+
+    def write_encoded(self, encoded_row):
+        """Append one result row that is already JSON-encoded"""
+        if self._ndjson:
+            self._out.write(encoded_row + b'\n')
+        else:
+            if self.count:
+                self._out.write(b', ')
+            self._out.write(encoded_row)
+        self.count += 1
+
+    def close(self):
+        """Finish the document and upload it. Returns the S3 key."""
+        try:
+            if not self._ndjson:
+                self._out.write(f'], "result_count": {self.count}}}'.encode('utf-8'))
+            if self._out is not self._sink:
+                self._out.close()  # flush the compressor, the sink stays open
+            self._sink.finish(self.archive_format.put_args(self.count))
+        except Exception as e:
+            self._sink.abort()
+            logger.error(f"Error storing streamed results in S3: {str(e)}")
+        return self.key
+
+    def abort(self):
+        """Discard the partial archive"""
+        self._sink.abort()
+
 class S3Handler:
     def __init__(self, testing=False):
         # For testing, we'll use the moto mock or localstack
@@ -19,24 +266,74 @@ class S3Handler:
         # Check if we're using localstack
         self.using_localstack = os.getenv('AWS_ENDPOINT_URL') is not None
         
-        # Configure S3 client - don't specify credentials in Lambda
-        # Instead rely on the Lambda's IAM role
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=os.getenv('AWS_ENDPOINT_URL'),  # For localstack testing
-        )
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'user-queries')
-        
+        # Created on first use, which keeps boto3 and the bucket check out of
+        # the Lambda init phase
+        self._s3_client = None
+        self._client_lock = threading.Lock()
+
+        # Optional background writer. Lambda freezes the process between
+        # invocations, so queued uploads would stall there; keep it synchronous.
+        self.writer = None
+        if os.getenv('S3_BACKGROUND_WRITES', 'false').lower() == 'true':
+            if os.getenv('AWS_LAMBDA_FUNCTION_NAME'):
+                logger.info("S3_BACKGROUND_WRITES ignored in Lambda, uploading synchronously")
+            else:
+                self.writer = S3BackgroundWriter(
+                    self.put_object,
+                    max_queue=int(os.getenv('S3_WRITER_QUEUE_SIZE', 1000)),
+                    workers=int(os.getenv('S3_WRITER_WORKERS', 2)),
+                    batch_size=int(os.getenv('S3_WRITER_BATCH_SIZE', 25)),
+                    enqueue_timeout=float(os.getenv('S3_WRITER_ENQUEUE_TIMEOUT', 0.05))
+                )
+
+        # Optional bundling of archives into partitioned objects, off in Lambda
+        # for the same reason as the background writer
+        self.bundler = None
+        if os.getenv('S3_ARCHIVE_BUNDLES', 'false').lower() == 'true':
+            if os.getenv('AWS_LAMBDA_FUNCTION_NAME'):
+                logger.info("S3_ARCHIVE_BUNDLES ignored in Lambda, storing one object per query")
+            else:
+                self.bundler = ArchiveBundler(self.put_object)
+
+        self.content_addressed = CONTENT_ADDRESSED
+        self.archive_format = ArchiveFormat()
+        self.known_keys = KnownKeys()
+
+    @property
+    def s3_client(self):
+        """boto3 S3 client, created and the bucket checked on first access"""
+        if self._s3_client is None:
+            with self._client_lock:
+                if self._s3_client is None:
+                    import boto3
+
+                    # Don't specify credentials in Lambda, rely on the function's IAM role
+                    client = boto3.client(
+                        's3',
+                        endpoint_url=os.getenv('AWS_ENDPOINT_URL'),  # For localstack testing
+                        config=client_config(),
+                    )
+                    self._check_bucket(client)
+                    self._s3_client = client
+        return self._s3_client
+
+    @s3_client.setter
+    def s3_client(self, client):
+        self._s3_client = client
+
+    def _check_bucket(self, client):
+        """Make sure the query bucket exists (localstack buckets are created)"""
         # Create bucket if using localstack
         if self.using_localstack:
             try:
                 # Check if bucket exists first
                 try:
-                    self.s3_client.head_bucket(Bucket=self.bucket_name)
+                    client.head_bucket(Bucket=self.bucket_name)
                     logger.info(f"Bucket already exists in localstack: {self.bucket_name}")
                 except Exception:
                     # Create bucket with region configuration for localstack
-                    self.s3_client.create_bucket(
+                    client.create_bucket(
                         Bucket=self.bucket_name,
                         CreateBucketConfiguration={
                             'LocationConstraint': os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
@@ -50,7 +347,7 @@ class S3Handler:
         elif not self.testing:
             # Check if bucket exists, but don't try to create it (S3 buckets should be pre-created by Terraform)
             try:
-                self.s3_client.head_bucket(Bucket=self.bucket_name)
+                client.head_bucket(Bucket=self.bucket_name)
                 logger.info(f"Bucket exists: {self.bucket_name}")
             except Exception as e:
                 logger.error(f"Error with S3 bucket: {str(e)}")
@@ -58,50 +355,160 @@ class S3Handler:
 
     def store_query_result(self, query_params, results):
         """Store query results in S3 and return the file path"""
-        # Make sure results is properly serialized
-        serialized_results = []
-        for item in results:
-            if hasattr(item, '__dict__'):
-                # This is an ORM object, extract only the data we need
-                serialized_item = {}
-                for key, value in vars(item).items():
-                    if not key.startswith('_'):  # Skip SQLAlchemy internals
-                        if hasattr(value, 'isoformat'):  # Convert datetime
-                            serialized_item[key] = value.isoformat()
-                        else:
-                            serialized_item[key] = value
-                serialized_results.append(serialized_item)
-            else:
-                # Already a dict, just add it
-                serialized_results.append(item)
-                
+        # Rows encoded by the caller are archived as they are, without another pass
+        if isinstance(results, EncodedRows):
+            serialized_results = results
+        else:
+            # Make sure results is properly serialized
+            serialized_results = []
+            for item in results:
+                if hasattr(item, '__dict__'):
+                    # This is an ORM object, extract only the data we need
+                    serialized_item = {}
+                    for key, value in vars(item).items():
+                        if not key.startswith('_'):  # Skip SQLAlchemy internals
+                            if hasattr(value, 'isoformat'):  # Convert datetime
+                                serialized_item[key] = value.isoformat()
+                            else:
+                                serialized_item[key] = value
+                    serialized_results.append(serialized_item)
+                else:
+                    # Already a dict, just add it
+                    serialized_results.append(item)
+
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         unique_id = str(uuid.uuid4())
-        filename = f"queries/{timestamp}_{unique_id}.json"
+        extension = self.archive_format.extension
+        if self.content_addressed:
+            filename = content_key(query_params, serialized_results, extension)
+        else:
+            filename = f"queries/{timestamp}_{unique_id}{extension}"
 
         # For testing with moto (not localstack), just return a mock filename
         if self.testing and not self.using_localstack:
             return f"mock-s3-file-{unique_id}.json"
 
+        now = datetime.utcnow()
         data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat(),
             "query_parameters": query_params,
             "results": serialized_results,
             "result_count": len(serialized_results)
         }
+        # Bundled archives always use the json layout; the bundle is gzipped
+        if self.bundler is not None:
+            return self.bundler.add(
+                unique_id, JSON_ARCHIVE.serialize(data), now, result_count=len(serialized_results)
+            )
+        # Identical results were already stored under this key
+        if self.content_addressed and filename in self.known_keys:
+            logger.debug(f"Query results already stored in S3: {filename}")
+            return filename
+        body = self.archive_format.encode(data)
+        put_args = self.archive_format.put_args(len(serialized_results))
+
+        # The key is known up front, so with the background writer the caller
+        # gets it back immediately and the upload happens off the request path
+        if self.writer is not None:
+            self.writer.submit(filename, body, if_absent=self.content_addressed, **put_args)
+            return filename
 
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=filename,
-                Body=json.dumps(data, default=str),
-                ContentType='application/json'
-            )
-            logger.info(f"Stored query results in S3: {filename}")
+            self.put_object(filename, body, if_absent=self.content_addressed, **put_args)
             return filename
         except Exception as e:
             logger.error(f"Error storing results in S3: {str(e)}")
             if self.testing:
                 return f"mock-s3-file-{unique_id}.json"
             # Return a fallback, but don't crash the app
-            return f"error-storing-{unique_id}.json" 
+            return f"error-storing-{unique_id}.json"
+
+    def put_object(self, key, body, if_absent=False, ContentType='application/json', **put_args):
+        """Upload a document to the query bucket.
+
+        With if_absent the upload is skipped when the key already exists, which
+        is only safe for content-addressed keys. Extra keyword arguments
+        (ContentEncoding, Metadata) are passed to S3 as is.
+        """
+        if if_absent:
+            if key in self.known_keys:
+                return
+            if self.object_exists(key):
+                self.known_keys.add(key)
+                logger.debug(f"Query results already stored in S3: {key}")
+                return
+        if len(body) > MULTIPART_THRESHOLD:
+            # Parallel parts instead of one long PUT (and its 5 GB limit)
+            upload = self.start_multipart_upload(key, ContentType=ContentType, **put_args)
+            try:
+                upload.write_body(body)
+                upload.complete()
+            except Exception:
+                upload.abort()
+                raise
+        else:
+            with S3_REQUEST_DURATION.labels("put_object").time():
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    Body=body,
+                    ContentType=ContentType,
+                    **put_args
+                )
+            S3_UPLOADED_BYTES.labels("put_object").inc(len(body))
+        if if_absent:
+            self.known_keys.add(key)
+        logger.info(f"Stored query results in S3: {key}")
+
+    def object_exists(self, key):
+        """HEAD the key; errors other than 404 count as missing so the upload still happens"""
+        from botocore.exceptions import ClientError
+
+        try:
+            with S3_REQUEST_DURATION.labels("head_object").time():
+                self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                logger.warning(f"Could not check S3 key {key}: {str(e)}")
+            return False
+
+    def read_bundled_archive(self, locator):
+        """Archive stored under a bundle locator returned by store_query_result"""
+        return read_bundled_archive(self.s3_client, self.bucket_name, locator)
+
+    def open_archive_stream(self, query_params):
+        """Start an archive that is filled row by row (see QueryArchiveStream)"""
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        unique_id = str(uuid.uuid4())
+        # For testing with moto (not localstack), build the archive but skip the upload
+        archive_format = self.archive_format.for_stream()
+        if self.testing and not self.using_localstack:
+            return QueryArchiveStream(
+                self, f"mock-s3-file-{unique_id}.json", query_params, upload=False, archive_format=archive_format
+            )
+        return QueryArchiveStream(
+            self, f"queries/{timestamp}_{unique_id}{archive_format.extension}", query_params,
+            archive_format=archive_format
+        )
+
+    def start_multipart_upload(self, key, **put_args):
+        """Begin a multipart upload to the query bucket (see MultipartUpload)"""
+        return MultipartUpload(self.s3_client, self.bucket_name, key, **put_args)
+
+    def flush(self, timeout=None):
+        """Wait for queued background uploads and upload buffered bundles, if any"""
+        flushed = True
+        if self.bundler is not None:
+            flushed = self.bundler.flush(timeout)
+        if self.writer is not None:
+            flushed = self.writer.flush(timeout) and flushed
+        return flushed
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """Flush and stop the bundler and the background writer, if any, within `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        if self.bundler is not None:
+            self.bundler.close(timeout)
+        if self.writer is not None:
+            self.writer.close(max(0.0, deadline - time.monotonic()))
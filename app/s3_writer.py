@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# Sentinel used to stop worker threads
+_STOP = object()
+
+class S3BackgroundWriter:
+    """Bounded in-process queue of pending S3 uploads drained by worker threads.
+
+    Callers get control back as soon as the upload is queued. When the queue is
+    full, submit() waits up to `enqueue_timeout` seconds and then uploads in the
+    caller's thread, so a slow S3 pushes back on the request path instead of
+    dropping archives or growing memory without bound.
+    """
+
+    def __init__(self, put_fn, max_queue=1000, workers=2, batch_size=25, enqueue_timeout=0.05):
+        self.put_fn = put_fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "sync_fallbacks": 0,
+            "batches": 0,
+            "queue_high_water": 0,
+        }
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"s3-writer-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started S3 background writer with {self.workers} workers")
+
+    def submit(self, key, body, **put_kwargs):
+        """Queue an upload; falls back to a synchronous put when the queue stays full"""
+        self.start()
+        try:
+            self._queue.put((key, body, put_kwargs), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._incr("sync_fallbacks")
+            logger.warning(f"S3 writer queue full, uploading {key} synchronously")
+            self._put(key, body, put_kwargs)
+            return
+        self._incr("enqueued")
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self._stats["queue_high_water"]:
+                self._stats["queue_high_water"] = depth
+
+    def flush(self, timeout=None):
+        """Wait until every queued upload has been attempted. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Flush pending uploads and stop the workers within `timeout` seconds"""
+        if not self._threads:
+            return
+        deadline = time.monotonic() + timeout
+        if not self.flush(timeout):
+            logger.error(f"S3 writer flush timed out with {self._queue.qsize()} uploads pending")
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break  # out of time; the daemon threads die with the process
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def stats(self):
+        """Return a snapshot of the writer counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self._queue.qsize()
+        snapshot["queue_capacity"] = self._queue.maxsize
+        return snapshot
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            # Drain whatever else is already waiting, up to batch_size items
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            for key, body, put_kwargs in batch:
+                self._put(key, body, put_kwargs)
+                self._queue.task_done()
+            self._incr("batches")
+
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _put(self, key, body, put_kwargs):
+        try:
+            self.put_fn(key, body, **put_kwargs)
+            self._incr("written")
+        except Exception as e:
+            self._incr("failed")
+            logger.error(f"Background S3 upload of {key} failed: {str(e)}")
+
+    def _incr(self, name):
+        with self._lock:
+            self._stats[name] += 1
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -16,10 +16,38 @@ class UserResponse(UserBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class UserProjection(BaseModel):
+    """A user narrowed with GET /users?fields=; only the requested columns are present"""
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    age: Optional[int] = None
+    city: Optional[str] = None
+
 class UserQueryResponse(BaseModel):
-    users: List[UserResponse]
+    users: List[Union[UserResponse, UserProjection]]
     count: int
     s3_file: str
     timestamp: datetime
+    next_cursor: Optional[str] = None
     
     model_config = ConfigDict(from_attributes=True) 
+
+class CityCount(BaseModel):
+    city: Optional[str]
+    count: int
+
+class AgeBucket(BaseModel):
+    min_age: int
+    max_age: int
+    count: int
+
+class UserStatsResponse(BaseModel):
+    count: int
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    avg_age: Optional[float] = None
+    cities: List[CityCount]
+    age_buckets: List[AgeBucket]
+    s3_file: Optional[str] = None
+    timestamp: datetime
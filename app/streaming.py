@@ -0,0 +1,106 @@
+import os
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from aws_lambda_powertools import Logger
+
+# Smart import system that works in all environments
+try:
+    # First try relative imports (works in Docker)
+    from .database import open_read_session, open_async_read_session
+    from .models import User
+    from .encoding import dumps
+    from .metrics import USERS_ROWS_RETURNED
+    from . import crud
+except (ImportError, ValueError):
+    try:
+        # Then try absolute imports with 'app' prefix (works in tests)
+        from app.database import open_read_session, open_async_read_session
+        from app.models import User
+        from app.encoding import dumps
+        from app.metrics import USERS_ROWS_RETURNED
+        from app import crud
+    except ImportError:
+        # Finally try direct imports (works in Lambda)
+        from database import open_read_session, open_async_read_session
+        from models import User
+        from encoding import dumps
+        from metrics import USERS_ROWS_RETURNED
+        import crud
+
+logger = Logger()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Rows fetched per round trip from the server-side cursor
+STREAM_BATCH_SIZE = int(os.getenv("USERS_STREAM_BATCH_SIZE", 1000))
+
+def _users_statement(filters: dict, after_id: Optional[int], fields: Tuple[str, ...]):
+    """Select matching users in id order through a server-side cursor"""
+    stmt = crud.filter_users(crud.select_fields(fields), **filters)
+    if after_id is not None:
+        stmt = stmt.where(User.id > after_id)
+    # yield_per implies stream_results, so psycopg2/asyncpg use a named cursor
+    return stmt.order_by(User.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+
+def _encode_partition(rows, archive) -> bytes:
+    """Encode a batch of rows as NDJSON and append them to the archive"""
+    chunk = bytearray()
+    for row in rows:
+        encoded = dumps(row._asdict())
+        archive.write_encoded(encoded)
+        chunk += encoded
+        chunk += b"\n"
+    return bytes(chunk)
+
+def stream_users(filters: dict, after_id: Optional[int], archive, fields: Tuple[str, ...] = crud.USER_FIELDS,
+                 primary: bool = False):
+    """Yield NDJSON chunks for all matching users using a sync session.
+
+    The session is owned by the generator rather than the request dependency,
+    because it has to outlive the route handler; it reads from a replica
+    unless `primary` is set. The archive is uploaded once the last row is sent
+    and discarded if the stream fails or is cancelled.
+    """
+    completed = False
+    db = None
+    try:
+        db = open_read_session(primary)
+        result = db.execute(_users_statement(filters, after_id, fields))
+        for partition in result.partitions():
+            yield _encode_partition(partition, archive)
+        completed = True
+    except Exception as e:
+        logger.error(f"Error streaming users: {str(e)}")
+        raise
+    finally:
+        if db is not None:
+            db.close()
+        if completed:
+            archive.close()
+            USERS_ROWS_RETURNED.labels("stream").observe(archive.count)
+            logger.info(f"Streamed {archive.count} users")
+        else:
+            archive.abort()
+
+async def stream_users_async(filters: dict, after_id: Optional[int], archive,
+                             fields: Tuple[str, ...] = crud.USER_FIELDS, primary: bool = False):
+    """Async variant of stream_users for DATABASE_ASYNC=true"""
+    completed = False
+    try:
+        async with await open_async_read_session(primary) as db:
+            result = await db.stream(_users_statement(filters, after_id, fields))
+            async for partition in result.partitions():
+                # Archive writes can block on a multipart part upload, keep them off the loop
+                yield await run_in_threadpool(_encode_partition, partition, archive)
+        completed = True
+    except Exception as e:
+        logger.error(f"Error streaming users: {str(e)}")
+        raise
+    finally:
+        if completed:
+            await run_in_threadpool(archive.close)
+            USERS_ROWS_RETURNED.labels("stream").observe(archive.count)
+            logger.info(f"Streamed {archive.count} users")
+        else:
+            archive.abort()
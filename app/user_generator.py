@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import random
+import re
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+# Number of distinct first names, last names and cities sampled from Faker
+VOCAB_SIZE = int(os.getenv("GENERATOR_VOCAB_SIZE", 1000))
+AGES = range(18, 81)
+# Rows drawn from one RNG; fixed so output does not depend on the batch size
+BLOCK_SIZE = 1024
+
+UserRow = Tuple[str, str, int, str]
+
+def _slug(value: str) -> str:
+    """Lowercase a name for use in an email local part"""
+    return re.sub(r"[^a-z0-9]", "", value.lower()) or "user"
+
+class UserGenerator:
+    """Fast, seeded generator of (name, email, age, city) rows.
+
+    Faker is only used once, to sample name, city and domain vocabularies.
+    Rows are then drawn from those lists in fixed-size blocks with
+    random.choices, using an RNG seeded from (seed, run tag, block), so any
+    range of rows can be rebuilt independently and in any process. Emails embed
+    the run tag and the row index, which makes them unique within a run by
+    construction.
+    """
+
+    def __init__(self, seed: Optional[int] = None, vocab_size: int = VOCAB_SIZE):
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.run_tag = format(self.seed, "x")
+        self._build_vocabulary(vocab_size)
+
+    def _build_vocabulary(self, vocab_size: int):
+        from faker import Faker  # only needed here, and it is slow to import
+
+        fake = Faker()
+        fake.seed_instance(self.seed)
+        # dict.fromkeys de-duplicates while keeping the sampled order stable
+        firsts = list(dict.fromkeys(fake.first_name() for _ in range(vocab_size)))
+        lasts = list(dict.fromkeys(fake.last_name() for _ in range(vocab_size)))
+        self.first_names = [(name, _slug(name)) for name in firsts]
+        self.last_names = [(name, _slug(name)) for name in lasts]
+        self.cities = list(dict.fromkeys(fake.city() for _ in range(vocab_size)))
+        self.domains = list(dict.fromkeys(
+            [fake.free_email_domain() for _ in range(20)] + [fake.domain_name() for _ in range(50)]
+        ))
+
+    def batch(self, start: int, size: int, run_tag: Optional[str] = None) -> List[UserRow]:
+        """Build rows start .. start + size - 1 of a run"""
+        tag = run_tag or self.run_tag
+        rows = []
+        first_block = start // BLOCK_SIZE
+        last_block = (start + size - 1) // BLOCK_SIZE
+        for block in range(first_block, last_block + 1):
+            rows.extend(self._block(block, tag))
+        offset = start - first_block * BLOCK_SIZE
+        return rows[offset:offset + size]
+
+    def _block(self, block: int, tag: str) -> List[UserRow]:
+        rng = random.Random(f"{self.seed}:{tag}:{block}")
+        size = BLOCK_SIZE
+        firsts = rng.choices(self.first_names, k=size)
+        lasts = rng.choices(self.last_names, k=size)
+        ages = rng.choices(AGES, k=size)
+        cities = rng.choices(self.cities, k=size)
+        domains = rng.choices(self.domains, k=size)
+        start = block * size
+        return [
+            (f"{first} {last}", f"{first_slug}.{last_slug}.{tag}.{index}@{domain}", age, city)
+            for index, (first, first_slug), (last, last_slug), age, city, domain
+            in zip(range(start, start + size), firsts, lasts, ages, cities, domains)
+        ]
+
+    def rows(self, count: int, batch_size: int = 10000, run_tag: Optional[str] = None,
+             workers: int = 1) -> Iterator[UserRow]:
+        """Lazily yield `count` rows, generating batches in `workers` processes if > 1"""
+        starts = range(0, count, batch_size)
+        if workers <= 1:
+            for start in starts:
+                yield from self.batch(start, min(batch_size, count - start), run_tag)
+            return
+
+        # Keep a bounded window of batches in flight so a slow consumer (the
+        # database) does not make finished batches pile up in memory. Workers
+        # are spawned: forking the threaded server can copy held locks
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self,)) as pool:
+            remaining = iter(starts)
+            pending = deque(
+                pool.submit(_worker_batch, start, min(batch_size, count - start), run_tag)
+                for start in islice(remaining, workers * 2)
+            )
+            while pending:
+                batch = pending.popleft().result()
+                start = next(remaining, None)
+                if start is not None:
+                    pending.append(pool.submit(_worker_batch, start, min(batch_size, count - start), run_tag))
+                yield from batch
+
+# Generator shared by the tasks of one worker process
+_worker_generator = None
+
+def _init_worker(generator: UserGenerator):
+    global _worker_generator
+    _worker_generator = generator
+
+def _worker_batch(start: int, size: int, run_tag: Optional[str]) -> List[UserRow]:
+    return _worker_generator.batch(start, size, run_tag)
+
+_default_generator = None
+
+def get_generator(seed: Optional[int] = None) -> UserGenerator:
+    """Return a generator for `seed`; unseeded callers share one cached instance"""
+    global _default_generator
+    if seed is not None:
+        return UserGenerator(seed)
+    if _default_generator is None:
+        _default_generator = UserGenerator()
+    return _default_generator
+
+def generate_users(count: int, unique: Optional[str] = None, seed: Optional[int] = None,
+                   batch_size: int = 10000, workers: int = 1) -> Iterator[UserRow]:
+    """Rows for one populate run.
+
+    The run tag is `unique` if given, else derived from `seed` (so a seeded run
+    is fully reproducible), else random, so unseeded runs never collide.
+    """
+    generator = get_generator(seed)
+    run_tag = unique or (generator.run_tag if seed is not None else uuid.uuid4().hex[:8])
+    return generator.rows(count, batch_size, run_tag, workers)
@@ -0,0 +1,44 @@
+import math
+import os
+
+# Worker processes per CPU of the container's quota, and the least started
+# whatever the quota (so that one worker can be recycled while another serves)
+WORKERS_PER_CPU = float(os.getenv("GUNICORN_WORKERS_PER_CPU", 1))
+MIN_WORKERS = int(os.getenv("GUNICORN_MIN_WORKERS", 2))
+
+def cpu_limit(cgroup_root="/sys/fs/cgroup"):
+    """CPUs this container may use: its cgroup CPU quota, else the CPUs it can run on.
+
+    os.cpu_count() reports the node's CPUs, not the container limit; sizing
+    workers from it starts far more processes than the quota can schedule.
+    """
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" without a limit
+        with open(os.path.join(cgroup_root, "cpu.max")) as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means no limit
+            with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+            if quota > 0 and period > 0:
+                return quota / period
+        except (OSError, ValueError):
+            pass
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def worker_count(cpus):
+    """Worker processes for `cpus` CPUs; WEB_CONCURRENCY overrides the computed count"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    return max(MIN_WORKERS, math.ceil(cpus * WORKERS_PER_CPU))
+
+def pool_size_per_worker(max_connections, workers, engines=1):
+    """Connections each of a worker's `engines` pools may hold so that all of them stay within `max_connections`"""
+    return max(1, max_connections // (workers * engines))
@@ -0,0 +1,135 @@
+"""Cold start of the Lambda entry point, checked against a time budget.
+
+Every run starts a fresh interpreter, like a new Lambda execution
+environment, imports app.main (the init phase) and invokes lambda_handler
+once with a GET /healthcheck event (the first invocation, which also creates
+the schema). Each run also times, in its own fresh interpreter, the import of
+the frameworks app.main cannot do without (REFERENCE_MODULES), so the budget
+can be set relative to the machine the check runs on. The exit status is 1
+when the median import time exceeds --budget-ratio times the reference
+median, when it exceeds --budget-ms, or when a module that should load lazily
+(DEFERRED_MODULES) was imported during init, so the CI build can enforce them:
+
+    DATABASE_URL=sqlite:////tmp/cold_start.db python benchmarks/cold_start.py --budget-ratio 1.8
+
+--top N also lists the N slowest imports made by app.main in one run
+(python -X importtime).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once a request uses them: boto3 for the first S3 call, Faker
+# to generate users. botocore is not listed: Powertools' Tracer imports the
+# X-Ray SDK, which loads botocore.session, even when tracing is disabled.
+DEFERRED_MODULES = ("boto3", "faker")
+
+# The floor of any app.main import. A shared CI runner may be several times
+# slower than a laptop, but it is slower for these imports as well.
+REFERENCE_MODULES = ("fastapi", "pydantic", "sqlalchemy.orm")
+
+REFERENCE_CHILD = """
+import json, time
+start = time.perf_counter()
+import %s
+print(json.dumps({"import_ms": (time.perf_counter() - start) * 1000}))
+""" % ", ".join(REFERENCE_MODULES)
+
+CHILD = """
+import json, sys, time
+from types import SimpleNamespace
+start = time.perf_counter()
+from app.main import lambda_handler
+imported = time.perf_counter()
+deferred_loaded = [name for name in %r if name in sys.modules]
+event = {
+    "httpMethod": "GET", "path": "/healthcheck", "queryStringParameters": None,
+    "headers": {"Accept": "application/json"}, "pathParameters": None, "body": None,
+    "isBase64Encoded": False, "resource": "/healthcheck",
+    "requestContext": {"identity": {"sourceIp": "127.0.0.1"}, "httpMethod": "GET",
+                       "path": "/healthcheck", "protocol": "HTTP/1.1"},
+}
+context = SimpleNamespace(function_name="cold-start", memory_limit_in_mb=128, aws_request_id="cold-start",
+                          invoked_function_arn="arn:aws:lambda:us-east-1:000000000000:function:cold-start")
+status = lambda_handler(event, context)["statusCode"]
+invoked = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_invoke_ms": (invoked - imported) * 1000,
+    "status": status,
+    "modules": len(sys.modules),
+    "deferred_loaded": deferred_loaded,
+}))
+""" % (DEFERRED_MODULES,)
+
+def run_child(importtime=False, code=CHILD):
+    """Run code (CHILD by default) in a new interpreter; returns its metrics and stderr"""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.exit(f"cold start run failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def slowest_imports(importtime_output, count):
+    """Modules imported directly by app.main (and the interpreter) with the largest cumulative time, in ms"""
+    totals = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Names are indented two spaces per nesting level; skip the header
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth == 1:
+            totals[name.strip()] = int(cumulative) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ratio", type=float, default=float(os.getenv("COLD_START_BUDGET_RATIO", 0)) or None,
+                        help="largest allowed median import time, as a multiple of the reference import")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("COLD_START_BUDGET_MS", 0)) or None,
+                        help="largest allowed median import time, in ms")
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest top-level imports")
+    args = parser.parse_args()
+
+    # Interleaved, so a slow spell on a shared runner hits both sides
+    results, references = [], []
+    for _ in range(args.runs):
+        references.append(run_child(code=REFERENCE_CHILD)[0]["import_ms"])
+        results.append(run_child()[0])
+    import_ms = statistics.median(result["import_ms"] for result in results)
+    reference_ms = statistics.median(references)
+    invoke_ms = statistics.median(result["first_invoke_ms"] for result in results)
+    print(f"import app.main      median {import_ms:8.1f} ms  (max {max(r['import_ms'] for r in results):.1f})")
+    print(f"reference imports    median {reference_ms:8.1f} ms  (app.main is {import_ms / reference_ms:.2f}x)")
+    print(f"first invocation     median {invoke_ms:8.1f} ms  (status {results[0]['status']})")
+    print(f"modules loaded       {results[0]['modules']}")
+
+    if args.top:
+        _, stderr = run_child(importtime=True)
+        for name, ms in slowest_imports(stderr, args.top):
+            print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    if args.budget_ratio and import_ms > args.budget_ratio * reference_ms:
+        failures.append(f"median import time {import_ms:.1f} ms is over {args.budget_ratio:.2f}x "
+                        f"the {reference_ms:.1f} ms reference")
+    if args.budget_ms and import_ms > args.budget_ms:
+        failures.append(f"median import time {import_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    deferred = sorted({name for result in results for name in result["deferred_loaded"]})
+    if deferred:
+        failures.append(f"imported during init instead of on first use: {', '.join(deferred)}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("within budget")
+
+if __name__ == "__main__":
+    main()
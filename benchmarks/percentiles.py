@@ -0,0 +1,6 @@
+"""Helpers shared by the benchmark scripts"""
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples` (pct in 0-100)"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
@@ -18,7 +18,7 @@ cp $APP_DIR/*.py $LAMBDA_PACKAGE_DIR/
 
 # Create temporary requirements file without localstack and testing packages
 echo "Creating temporary requirements file without problematic packages..."
-grep -v -E "localstack|pytest" $REQUIREMENTS_FILE > $TMP_REQUIREMENTS
+grep -v -E "localstack|pytest|gunicorn" $REQUIREMENTS_FILE > $TMP_REQUIREMENTS
 
 # Install dependencies with Lambda-specific flags
 echo "Installing dependencies from filtered requirements..."
@@ -7,14 +7,19 @@ setup(
     install_requires=[
         "fastapi",
         "uvicorn",
+        "gunicorn",
         "sqlalchemy",
         "psycopg2-binary",
+        "orjson",
+        "zstandard",
+        "asyncpg",
         "mangum",
         "faker",
         "boto3",
         "aws-lambda-powertools",
         "aws-xray-sdk",
         "python-json-logger",
+        "prometheus-client",
     ],
     python_requires=">=3.11",
 ) 
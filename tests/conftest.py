@@ -1,6 +1,8 @@
 import pytest
+import io
 import os
 import sys
+import threading
 import docker
 import boto3
 import time
@@ -23,6 +25,7 @@ from sqlalchemy.orm import Session
 from app.database import Base
 from app.models import User
 from moto import mock_aws
+from botocore.exceptions import ClientError
 from app.s3_utils import S3Handler
 import platform
 
@@ -241,3 +244,66 @@ def mock_s3_bucket(monkeypatch):
 def s3_handler():
     """Create an S3 handler instance for testing"""
     return S3Handler() 
+
+class FakeS3:
+    """In-memory stand-in for the S3 client calls the archive code makes.
+
+    Counts HEAD and PUT requests, keeps each multipart part both as sent and
+    as bytes, and fails the upload of part `fail_part` when it is set.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.heads = 0
+        self.puts = 0
+        self.fail_part = None
+        self.parts = {}
+        self.bodies = {}
+        self.completed = None
+        self.aborted = False
+        self.create_args = None
+        self.lock = threading.Lock()
+
+    def put(self, key, body, **put_args):
+        """S3Handler.put_object-style callback, as ArchiveBundler takes"""
+        self.put_object(Bucket="bucket", Key=key, Body=body, **put_args)
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.puts += 1
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key, Range=None):
+        body = self.objects[Key]
+        if Range:
+            start, end = map(int, Range[len("bytes="):].split("-"))
+            body = body[start:end + 1]
+        return {"Body": io.BytesIO(body)}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.create_args = kwargs
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise RuntimeError("part upload failed")
+        with self.lock:
+            self.bodies[PartNumber] = Body
+            self.parts[PartNumber] = Body.read() if hasattr(Body, "read") else Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+@pytest.fixture
+def fake_s3():
+    """In-memory S3 client (see FakeS3)"""
+    return FakeS3()
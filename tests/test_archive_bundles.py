@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from app.archive_bundles import ArchiveBundler, manifest_key, read_bundled_archive
+
+def document(i):
+    return json.dumps({"timestamp": "t", "query_parameters": {"i": i}, "results": [{"id": i}], "result_count": 1}).encode()
+
+def test_bundles_roll_over_by_size_and_hour(tmp_path, fake_s3):
+    """Archives are packed per hour partition; a full bundle is sealed and a manifest written"""
+    s3 = fake_s3
+    bundler = ArchiveBundler(s3.put, max_bytes=200, max_seconds=60, spill_dir=str(tmp_path))
+    ten = datetime(2026, 10, 17, 10, 59)
+    locators = [bundler.add(f"q{i}", document(i), ten, result_count=1) for i in range(6)]
+    locators.append(bundler.add("q6", document(6), datetime(2026, 10, 17, 11, 0)))
+    bundler.close()
+
+    bundles = sorted(key for key in s3.objects if key.endswith(".ndjson.gz"))
+    assert len(bundles) >= 3
+    assert all("/dt=2026-10-17/hour=10/" in key for key in bundles[:-1])
+    assert "/dt=2026-10-17/hour=11/" in bundles[-1]
+    assert locators[-1].startswith(bundles[-1])
+    assert bundler.stats()["records"] == 7
+
+    # The concatenated gzip members read back as NDJSON in one pass
+    lines = [json.loads(line) for key in bundles for line in gzip.decompress(s3.objects[key]).splitlines()]
+    assert sorted(line["query_id"] for line in lines) == [f"q{i}" for i in range(7)]
+    manifest = json.loads(s3.objects[manifest_key(bundles[-1])])
+    assert manifest["record_count"] == 1 and manifest["records"][0]["query_id"] == "q6"
+
+def test_bundled_archive_is_read_with_a_range_request(tmp_path, fake_s3):
+    """A locator resolves through the manifest to the single archive's bytes"""
+    s3 = fake_s3
+    bundler = ArchiveBundler(s3.put, spill_dir=str(tmp_path))
+    now = datetime.utcnow()
+    locators = [bundler.add(f"q{i}", document(i), now) for i in range(3)]
+    assert bundler.flush(timeout=5)
+
+    archive = read_bundled_archive(s3, "bucket", locators[1])
+    assert archive["query_id"] == "q1"
+    assert archive["query_parameters"] == {"i": 1}
+    bundler.close()
+
+def test_open_bundle_is_uploaded_after_max_seconds(tmp_path, fake_s3):
+    """A partially filled bundle does not wait for more archives forever"""
+    s3 = fake_s3
+    bundler = ArchiveBundler(s3.put, max_seconds=0.1, spill_dir=str(tmp_path))
+    bundler.add("q0", document(0), datetime.utcnow())
+
+    deadline = time.monotonic() + 5
+    while bundler.stats()["bundles"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert bundler.stats()["bundles"] == 1
+    bundler.close()
+
+def test_failed_bundle_is_retried_then_spilled_and_recovered(tmp_path, fake_s3):
+    """A bundle S3 keeps refusing is kept on disk and uploaded once S3 is back"""
+    s3 = fake_s3
+    calls = []
+
+    def failing_put(key, body, **put_args):
+        calls.append(key)
+        raise RuntimeError("S3 unavailable")
+
+    bundler = ArchiveBundler(failing_put, attempts=3, retry_backoff=0.01, spill_dir=str(tmp_path))
+    locator = bundler.add("q0", document(0), datetime.utcnow())
+    assert bundler.flush(timeout=5)
+    bundler.close()
+    assert len(calls) == 3
+    assert bundler.stats()["spilled"] == 1
+    assert os.path.exists(os.path.join(str(tmp_path), locator.split("#")[0]))
+
+    recovering = ArchiveBundler(s3.put, max_seconds=0.05, spill_dir=str(tmp_path))
+    recovering.start()
+    deadline = time.monotonic() + 5
+    while recovering.stats()["recovered"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    recovering.close()
+
+    assert read_bundled_archive(s3, "bucket", locator)["query_id"] == "q0"
+    assert not os.path.exists(os.path.join(str(tmp_path), locator.split("#")[0]))
+
+def test_close_spills_what_it_cannot_upload_in_time(tmp_path):
+    """Shutdown stays within its timeout; bundles still queued go to disk"""
+    release = threading.Event()
+
+    def stuck_put(key, body, **put_args):
+        release.wait(5)
+
+    bundler = ArchiveBundler(stuck_put, max_bytes=1, max_pending=10, spill_dir=str(tmp_path))
+    for i in range(4):
+        bundler.add(f"q{i}", document(i), datetime.utcnow())
+
+    started = time.monotonic()
+    bundler.close(timeout=0.3)
+    assert time.monotonic() - started < 1
+    assert bundler.stats()["spilled"] >= 2
+    release.set()
@@ -0,0 +1,67 @@
+import json
+from collections import namedtuple
+import pytest
+from app.archive_format import ArchiveFormat, decode_archive
+from app.encoding import EncodedRows
+from app.s3_utils import QueryArchiveStream
+
+ROWS = [{"id": i, "name": f"User {i}", "email": f"u{i}@example.com", "age": 20 + i, "city": "Oslo"} for i in range(50)]
+DOCUMENT = {"timestamp": "2024-01-01T00:00:00", "query_parameters": {"city": "oslo"}, "results": ROWS, "result_count": 50}
+
+class UploadCapture:
+    def put_object(self, key, body, **put_args):
+        self.body = body
+        self.put_args = put_args
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson", "columnar"])
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_archive_round_trips(fmt, compression):
+    """Every layout decodes back to the same rows using only the object metadata"""
+    archive_format = ArchiveFormat(fmt, compression)
+    put_args = archive_format.put_args(len(ROWS))
+
+    decoded = decode_archive(archive_format.encode(DOCUMENT), put_args["Metadata"])
+
+    assert decoded["results"] == ROWS
+    assert decoded["query_parameters"] == {"city": "oslo"}
+    assert put_args["Metadata"]["result-count"] == "50"
+    assert ("ContentEncoding" in put_args) == (compression != "none")
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson", "columnar"])
+def test_pre_encoded_rows_are_reused(fmt):
+    """Rows encoded once for the HTTP response produce an equivalent archive"""
+    Row = namedtuple("Row", ROWS[0].keys())
+    rows = EncodedRows(Row(**row) for row in ROWS)
+    archive_format = ArchiveFormat(fmt, "none")
+
+    assert rows == ROWS
+    assert json.loads(rows.json_array()) == ROWS
+    decoded = decode_archive(archive_format.encode({**DOCUMENT, "results": rows}), archive_format.put_args()["Metadata"])
+    assert decoded == decode_archive(archive_format.encode(DOCUMENT), archive_format.put_args()["Metadata"])
+
+def test_compact_formats_are_smaller():
+    """Columnar drops the repeated keys and gzip shrinks it further"""
+    plain = len(ArchiveFormat("json", "none").encode(DOCUMENT))
+    columnar = len(ArchiveFormat("columnar", "none").encode(DOCUMENT))
+    compressed = len(ArchiveFormat("columnar", "gzip").encode(DOCUMENT))
+
+    assert compressed < columnar < plain
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_streamed_archive_matches_buffered(fmt, compression):
+    """Archives written row by row through the compressor decode to the same rows"""
+    handler = UploadCapture()
+    stream = QueryArchiveStream(handler, "key", {"city": "oslo"}, archive_format=ArchiveFormat(fmt, compression))
+    for row in ROWS:
+        stream.write(row)
+    stream.close()
+
+    decoded = decode_archive(handler.body, handler.put_args["Metadata"])
+    assert decoded["results"] == ROWS
+    assert decoded["result_count"] == 50
+    assert handler.put_args["ContentEncoding"] == compression
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        ArchiveFormat("xml", "none")
@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_import_defers_heavy_modules(tmp_path):
+    """Importing the Lambda entry point loads neither boto3 nor Faker, nor touches the database"""
+    database = tmp_path / "cold.db"
+    code = (
+        "import json, sys; import app.main; "
+        "print(json.dumps([name for name in ('boto3', 'faker') if name in sys.modules]))"
+    )
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}"}
+    env.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+
+    assert json.loads(completed.stdout.strip().splitlines()[-1]) == []
+    assert not database.exists() or database.stat().st_size == 0
+
+def test_s3_utils_defers_botocore():
+    """app.s3_utils loads botocore's config and exceptions only when an S3 client is used"""
+    code = (
+        "import json, sys; import app.s3_utils; "
+        "print(json.dumps([name for name in ('botocore.config', 'botocore.exceptions') if name in sys.modules]))"
+    )
+    env = {**os.environ, "DATABASE_URL": "sqlite://"}
+    env.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+
+    assert json.loads(completed.stdout.strip().splitlines()[-1]) == []
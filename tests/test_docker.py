@@ -121,7 +121,10 @@ def test_get_users_with_s3(docker_api_url, mock_s3_bucket):
                 "name": None,
                 "city": "New",
                 "min_age": 25,
-                "max_age": 50
+                "max_age": 50,
+                "limit": 100,
+                "cursor": None,
+                "fields": None
             }
             
             # Verify result count matches
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import text
+from app import database
+from app.database import engine, create_indexes, create_tables, index_validity
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "postgresql", reason="indexes are built on PostgreSQL only")
+
+def test_startup_leaves_index_builds_to_create_indexes(monkeypatch):
+    """create_tables only creates the tables; create_indexes builds the indexes"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in (*database.TRGM_INDEXES, *database.FALLBACK_INDEXES, *database.COVERING_INDEXES):
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    monkeypatch.setattr(database, "_tables_created", False)
+    create_tables()
+    with engine.connect() as conn:
+        assert index_validity(conn, "ix_users_id_email") is None
+
+    assert create_indexes(engine)["covering"] is True
+    with engine.connect() as conn:
+        assert index_validity(conn, "ix_users_id_email") is True
@@ -80,6 +80,34 @@ def test_lambda_healthcheck_direct(lambda_context):
     assert body["environment"] == "AWS Lambda"
     assert "timestamp" in body
 
+def test_lambda_metrics_direct(lambda_context):
+    """Test that /metrics exposes request latencies labelled by route template"""
+    def event(path):
+        return {
+            "httpMethod": "GET",
+            "path": path,
+            "queryStringParameters": None,
+            "headers": {"Accept": "text/plain"},
+            "requestContext": {
+                "identity": {"sourceIp": "127.0.0.1"},
+                "httpMethod": "GET",
+                "path": path,
+                "protocol": "HTTP/1.1"
+            },
+            "resource": path,
+            "pathParameters": None,
+            "body": None,
+            "isBase64Encoded": False
+        }
+
+    assert handler(event("/healthcheck"), lambda_context)["statusCode"] == 200
+    response = handler(event("/metrics"), lambda_context)
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/healthcheck",status="200"}' in response["body"]
+    assert "db_query_duration_seconds" in response["body"]
+
 def test_lambda_populate_users_direct(lambda_context):
     """Test the populate endpoint by directly invoking the Lambda handler"""
     # Create API Gateway event for POST /populate
@@ -124,6 +152,41 @@ def test_lambda_populate_users_direct(lambda_context):
     # Verify response structure
     assert body["message"] == "Created 5 users"
 
+def test_lambda_populate_bulk_direct(lambda_context):
+    """Test the bulk populate endpoint by directly invoking the Lambda handler"""
+    event = {
+        "httpMethod": "POST",
+        "path": "/populate/bulk",
+        "queryStringParameters": {"count": "250", "chunk_size": "100", "unique": str(uuid.uuid4())},
+        "headers": {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        },
+        "requestContext": {
+            "identity": {
+                "sourceIp": "127.0.0.1"
+            },
+            "httpMethod": "POST",
+            "path": "/populate/bulk",
+            "protocol": "HTTP/1.1"
+        },
+        "resource": "/populate/bulk",
+        "pathParameters": None,
+        "body": None,
+        "isBase64Encoded": False
+    }
+    
+    response = handler(event, lambda_context)
+    
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    
+    # Verify response structure
+    assert body["message"] == "Created 250 users"
+    assert body["rows"] == 250
+    assert body["method"] in ("copy", "insert")
+    assert body["rows_per_second"] > 0
+
 def test_lambda_get_users_direct(lambda_context, populated_db):
     """Test the get users endpoint by directly invoking the Lambda handler"""
     # Create API Gateway event for GET /users
@@ -259,6 +322,217 @@ def test_lambda_delete_user_direct(lambda_context, populated_db):
     response = handler(delete_event, lambda_context)
     assert response["statusCode"] == 404
 
+def test_lambda_get_users_paginated_direct(lambda_context, populated_db):
+    """Test keyset pagination of the get users endpoint"""
+    event = {
+        "httpMethod": "GET",
+        "path": "/users",
+        "queryStringParameters": {"limit": "1"},
+        "headers": {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        },
+        "requestContext": {
+            "identity": {
+                "sourceIp": "127.0.0.1"
+            },
+            "httpMethod": "GET",
+            "path": "/users",
+            "protocol": "HTTP/1.1"
+        },
+        "resource": "/users",
+        "pathParameters": None,
+        "body": None,
+        "isBase64Encoded": False
+    }
+    
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 200
+    first_page = json.loads(response["body"])
+    
+    # With more than one user in the table, a page of one must have a continuation
+    assert len(first_page["users"]) == 1
+    assert first_page["next_cursor"] is not None
+    
+    # The next page resumes strictly after the last id of the previous one
+    event["queryStringParameters"] = {"limit": "1", "cursor": first_page["next_cursor"]}
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 200
+    second_page = json.loads(response["body"])
+    assert len(second_page["users"]) == 1
+    assert second_page["users"][0]["id"] > first_page["users"][0]["id"]
+    
+    # A malformed cursor is a client error
+    event["queryStringParameters"] = {"cursor": "not-a-cursor"}
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 400
+
+def test_lambda_get_users_fields_direct(lambda_context, populated_db):
+    """Test narrowing the get users response with the fields parameter"""
+    event = {
+        "httpMethod": "GET",
+        "path": "/users",
+        "queryStringParameters": {"fields": "email", "limit": "5"},
+        "headers": {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        },
+        "requestContext": {
+            "identity": {
+                "sourceIp": "127.0.0.1"
+            },
+            "httpMethod": "GET",
+            "path": "/users",
+            "protocol": "HTTP/1.1"
+        },
+        "resource": "/users",
+        "pathParameters": None,
+        "body": None,
+        "isBase64Encoded": False
+    }
+    
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert len(body["users"]) > 0
+    
+    # id is always kept so the cursor keeps working
+    for user in body["users"]:
+        assert set(user) == {"id", "email"}
+    
+    # Only User columns can be requested
+    event["queryStringParameters"] = {"fields": "email,password"}
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 400
+
+def test_lambda_get_user_stats_direct(lambda_context, populated_db):
+    """Test the aggregate stats endpoint by directly invoking the Lambda handler"""
+    event = {
+        "httpMethod": "GET",
+        "path": "/users/stats",
+        "queryStringParameters": {"min_age": "25", "max_age": "60", "bucket_size": "10"},
+        "headers": {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        },
+        "requestContext": {
+            "identity": {
+                "sourceIp": "127.0.0.1"
+            },
+            "httpMethod": "GET",
+            "path": "/users/stats",
+            "protocol": "HTTP/1.1"
+        },
+        "resource": "/users/stats",
+        "pathParameters": None,
+        "body": None,
+        "isBase64Encoded": False
+    }
+    
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    
+    # The aggregates respect the filters and add up to the total count
+    assert body["count"] > 0
+    assert 25 <= body["min_age"] <= body["max_age"] <= 60
+    assert sum(city["count"] for city in body["cities"]) <= body["count"]
+    assert sum(bucket["count"] for bucket in body["age_buckets"]) == body["count"]
+    for bucket in body["age_buckets"]:
+        assert bucket["min_age"] % 10 == 0
+        assert bucket["max_age"] == bucket["min_age"] + 9
+
+def test_lambda_bulk_delete_users_direct(lambda_context):
+    """Test deleting several users by id in one request"""
+    from sqlalchemy import select
+    from app.database import SessionLocal
+    from app.models import User
+    tag = uuid.uuid4().hex
+    event = {
+        "httpMethod": "POST",
+        "path": "/populate",
+        "queryStringParameters": {"count": "5", "unique": tag},
+        "headers": {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        },
+        "requestContext": {
+            "identity": {
+                "sourceIp": "127.0.0.1"
+            },
+            "httpMethod": "POST",
+            "path": "/populate",
+            "protocol": "HTTP/1.1"
+        },
+        "resource": "/populate",
+        "pathParameters": None,
+        "body": None,
+        "isBase64Encoded": False
+    }
+    assert handler(event, lambda_context)["statusCode"] == 200
+    
+    # Only the users created above (their emails carry the run tag)
+    with SessionLocal() as db:
+        ids = [str(user_id) for user_id in db.scalars(
+            select(User.id).where(User.email.contains(tag)).order_by(User.id).limit(3)
+        )]
+    assert len(ids) == 3
+    
+    # Repeated ids are passed as a multi-value query parameter
+    event.update({"path": "/users", "resource": "/users"})
+    event["requestContext"]["path"] = "/users"
+    event.update({"httpMethod": "DELETE", "queryStringParameters": None,
+                  "multiValueQueryStringParameters": {"ids": ids}})
+    event["requestContext"]["httpMethod"] = "DELETE"
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["deleted"] == len(ids)
+    
+    # Deleting the same ids again finds nothing
+    response = handler(event, lambda_context)
+    assert json.loads(response["body"])["deleted"] == 0
+    
+    # Without ids or filters the request would match every user
+    event["multiValueQueryStringParameters"] = None
+    response = handler(event, lambda_context)
+    assert response["statusCode"] == 400
+
+def test_lambda_get_users_ndjson_direct(lambda_context, populated_db):
+    """Test the streaming NDJSON mode of the get users endpoint"""
+    event = {
+        "httpMethod": "GET",
+        "path": "/users",
+        "queryStringParameters": {"min_age": "25", "max_age": "50"},
+        "headers": {
+            "Accept": "application/x-ndjson",
+            "Content-Type": "application/json"
+        },
+        "requestContext": {
+            "identity": {
+                "sourceIp": "127.0.0.1"
+            },
+            "httpMethod": "GET",
+            "path": "/users",
+            "protocol": "HTTP/1.1"
+        },
+        "resource": "/users",
+        "pathParameters": None,
+        "body": None,
+        "isBase64Encoded": False
+    }
+    
+    response = handler(event, lambda_context)
+    
+    assert response["statusCode"] == 200
+    assert response["headers"]["content-type"].startswith("application/x-ndjson")
+    assert "x-s3-file" in response["headers"]
+    
+    # One JSON document per line, in id order
+    users = [json.loads(line) for line in response["body"].splitlines() if line]
+    assert len(users) > 0
+    assert all(25 <= user["age"] <= 50 for user in users)
+    assert [user["id"] for user in users] == sorted(user["id"] for user in users)
+
 @pytest.fixture
 def populated_db(db_session):
     """Fixture to populate test database with sample users"""
@@ -343,7 +617,10 @@ def test_get_users_with_s3_storage_lambda(mock_s3_bucket, lambda_context, popula
                 "name": None,
                 "city": "New",
                 "min_age": 25,
-                "max_age": 50
+                "max_age": 50,
+                "limit": 100,
+                "cursor": None,
+                "fields": None
             }
             
             # Verify result count matches
@@ -0,0 +1,57 @@
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from app.metrics import TimedQueuePool, instrument_engine
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_instrumented_engine_records_query_durations():
+    """Statements are timed by type; failed statements are not recorded"""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    instrument_engine(engine)
+    selects = sample("db_query_duration_seconds_count", operation="SELECT")
+    others = sample("db_query_duration_seconds_count", operation="OTHER")
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("PRAGMA user_version"))
+        try:
+            conn.execute(text("SELECT * FROM missing_table"))
+        except Exception:
+            pass
+        conn.execute(text("select 2"))
+
+    assert sample("db_query_duration_seconds_count", operation="SELECT") == selects + 2
+    assert sample("db_query_duration_seconds_count", operation="OTHER") == others + 1
+
+def test_timed_pool_records_checkout_wait(tmp_path):
+    """Every connection checkout adds a pool wait observation"""
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=TimedQueuePool)
+    checkouts = sample("db_pool_checkout_wait_seconds_count")
+
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    assert sample("db_pool_checkout_wait_seconds_count") == checkouts + 3
+
+def test_pool_gauges_track_utilization_and_timeouts(tmp_path):
+    """Capacity, checked-out connections and exhausted checkouts are exported per engine"""
+    engine = create_engine(f"sqlite:///{tmp_path}/gauges.db", poolclass=TimedQueuePool,
+                           pool_size=2, max_overflow=1, pool_timeout=0.01)
+    instrument_engine(engine, "gauges")
+    timeouts = sample("db_pool_checkout_timeouts_total")
+
+    connections = [engine.connect() for _ in range(3)]
+    assert sample("db_pool_capacity", engine="gauges") == 3
+    assert sample("db_pool_checked_out", engine="gauges") == 3
+    try:
+        engine.connect()
+    except Exception:
+        pass
+    assert sample("db_pool_checkout_timeouts_total") == timeouts + 1
+
+    for conn in connections:
+        conn.close()
+    assert sample("db_pool_checked_out", engine="gauges") == 0
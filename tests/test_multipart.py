@@ -0,0 +1,102 @@
+import pytest
+from app import multipart, s3_utils
+from app.archive_format import ArchiveFormat, decode_archive
+from app.multipart import MIN_PART_SIZE, MultipartUpload, PartBody
+from app.s3_utils import QueryArchiveStream
+
+def test_multipart_upload_sends_parts_in_order(fake_s3):
+    """Bytes written in small pieces are cut into full parts plus a short last one"""
+    s3 = fake_s3
+    data = bytes(range(256)) * (12 * 1024 * 1024 // 256)
+    upload = MultipartUpload(s3, "bucket", "key", part_size=MIN_PART_SIZE, concurrency=2)
+    for offset in range(0, len(data), 64 * 1024):
+        upload.write(data[offset:offset + 64 * 1024])
+    upload.complete()
+
+    assert [part["PartNumber"] for part in s3.completed] == [1, 2, 3]
+    assert b"".join(s3.parts[n] for n in sorted(s3.parts)) == data
+    assert len(s3.parts[1]) == MIN_PART_SIZE
+    assert not s3.aborted
+
+def test_multipart_upload_aborts_on_failure(fake_s3):
+    """A failed part aborts the whole upload instead of leaving parts behind"""
+    s3 = fake_s3
+    s3.fail_part = 2
+    upload = MultipartUpload(s3, "bucket", "key", part_size=MIN_PART_SIZE)
+    upload.write(b"x" * (MIN_PART_SIZE * 2 + 10))
+
+    with pytest.raises(RuntimeError):
+        upload.complete()
+    assert s3.aborted
+    assert s3.completed is None
+
+def test_large_streamed_archive_switches_to_multipart(monkeypatch, fake_s3):
+    """Past the threshold a streamed archive is uploaded in parts, not buffered whole"""
+    monkeypatch.setattr(s3_utils, "MULTIPART_THRESHOLD", 1024)
+    s3 = fake_s3
+
+    class Handler:
+        def start_multipart_upload(self, key, **put_args):
+            return MultipartUpload(s3, "bucket", key, **put_args)
+
+    archive_format = ArchiveFormat("ndjson", "none")
+    stream = QueryArchiveStream(Handler(), "key", {"city": None}, archive_format=archive_format)
+    rows = [{"id": i, "name": f"User {i}"} for i in range(500)]
+    for row in rows:
+        stream.write(row)
+    stream.close()
+
+    body = b"".join(s3.parts[n] for n in sorted(s3.parts))
+    assert s3.completed is not None
+    assert s3.create_args["ContentType"] == "application/x-ndjson"
+    assert decode_archive(body, s3.create_args["Metadata"])["results"] == rows
+
+def test_failed_part_drops_archive_but_not_the_stream(monkeypatch, fake_s3):
+    """A part upload error aborts the archive upload; every row is still written"""
+    monkeypatch.setattr(s3_utils, "MULTIPART_THRESHOLD", 1024)
+    monkeypatch.setattr(multipart, "MIN_PART_SIZE", 1024)
+    s3 = fake_s3
+    s3.fail_part = 1
+
+    class Handler:
+        def start_multipart_upload(self, key, **put_args):
+            return MultipartUpload(s3, "bucket", key, part_size=1024, concurrency=1, **put_args)
+
+    stream = QueryArchiveStream(Handler(), "key", {"city": None}, archive_format=ArchiveFormat("ndjson", "none"))
+    for i in range(500):
+        stream.write({"id": i, "name": f"User {i}"})
+
+    assert stream.close() == "key"
+    assert stream.count == 500
+    assert s3.aborted
+    assert s3.completed is None
+
+def test_failed_put_object_multipart_is_aborted(monkeypatch, fake_s3):
+    """put_object aborts its multipart upload when a part fails"""
+    monkeypatch.setattr(s3_utils, "MULTIPART_THRESHOLD", 1024)
+    monkeypatch.setattr(multipart, "MIN_PART_SIZE", 1024)
+    s3 = fake_s3
+    s3.fail_part = 1
+    handler = s3_utils.S3Handler()
+    handler.s3_client = s3
+    monkeypatch.setattr(handler, "start_multipart_upload",
+                        lambda key, **put_args: MultipartUpload(s3, "bucket", key, part_size=1024, concurrency=1))
+
+    with pytest.raises(RuntimeError):
+        handler.put_object("key", b"x" * 10000)
+    assert s3.aborted
+
+def test_put_object_sends_slices_of_the_body(monkeypatch, fake_s3):
+    """A large put_object body is uploaded as views into it, not copied into a part buffer"""
+    monkeypatch.setattr(s3_utils, "MULTIPART_THRESHOLD", 1024)
+    s3 = fake_s3
+    handler = s3_utils.S3Handler()
+    handler.s3_client = s3
+    monkeypatch.setattr(handler, "start_multipart_upload",
+                        lambda key, **put_args: MultipartUpload(s3, "bucket", key, part_size=MIN_PART_SIZE, concurrency=2))
+    body = bytes(range(256)) * (11 * 1024 * 1024 // 256)
+    handler.put_object("key", body)
+
+    assert b"".join(s3.parts[n] for n in sorted(s3.parts)) == body
+    assert all(isinstance(part, PartBody) for part in s3.bodies.values())
+    assert len(s3.bodies[1]) == MIN_PART_SIZE and len(s3.completed) == 3
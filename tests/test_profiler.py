@@ -0,0 +1,67 @@
+import os
+import time
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import profiler
+from app.profiler import ProfilerMiddleware, SamplingProfiler
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+def test_sampling_profiler_collapses_stacks():
+    """Stacks of the sampled threads are folded into collapsed lines"""
+    with SamplingProfiler(interval=0.001) as sampler:
+        busy_loop(0.1)
+
+    assert sampler.samples > 10
+    lines = sampler.collapsed().splitlines()
+    busy = [line for line in lines if "busy_loop (test_profiler.py:" in line]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert stack.startswith("MainThread;")
+    assert int(count) > 0
+
+def test_profiler_middleware_profiles_marked_requests(monkeypatch, tmp_path):
+    """Only requests with the right token are profiled and saved"""
+    monkeypatch.setattr(profiler, "PROFILER_TOKEN", "secret")
+    monkeypatch.setattr(profiler, "PROFILER_DIR", str(tmp_path))
+    app = FastAPI()
+    app.add_middleware(ProfilerMiddleware, s3_handler=SimpleNamespace(bucket_name="user-queries"))
+
+    @app.get("/work")
+    def work():
+        busy_loop(0.05)
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert "x-profile" not in client.get("/work").headers
+    assert "x-profile" not in client.get("/work", headers={"X-Profile-Token": "wrong"}).headers
+
+    response = client.get("/work", headers={"X-Profile-Token": "secret"})
+    assert response.json() == {"ok": True}
+    location = response.headers["x-profile"]
+    assert os.path.dirname(location) == str(tmp_path)
+    assert "-GET_work-" in location
+    with open(location) as f:
+        assert "work (test_profiler.py:" in f.read()
+    assert os.listdir(tmp_path) == [os.path.basename(location)]
+
+def test_non_ascii_token_is_rejected_not_an_error(monkeypatch):
+    """Header bytes >= 0x80 fail the token check instead of raising"""
+    monkeypatch.setattr(profiler, "PROFILER_TOKEN", "secret")
+    app = FastAPI()
+    app.add_middleware(ProfilerMiddleware, s3_handler=SimpleNamespace(bucket_name="user-queries"))
+
+    @app.get("/work")
+    def work():
+        return {"ok": True}
+
+    response = TestClient(app).get("/work", headers={"X-Profile-Token": "s\xe9cret".encode("latin-1")})
+    assert response.status_code == 200
+    assert "x-profile" not in response.headers
+    assert not profiler.token_matches("s\xe9cret")
+    assert not profiler.token_matches("s€cret")
+    assert profiler.token_matches("secret") and profiler.token_matches(b"secret")
@@ -0,0 +1,39 @@
+import time
+from app.query_cache import QueryCache
+
+def test_query_cache_normalizes_filters():
+    """Filters differing only in case or empty strings share an entry"""
+    cache = QueryCache()
+    cache.put(QueryCache.make_key("Ann", "", 20, None, 100), "page", cache.version)
+
+    assert cache.get(QueryCache.make_key("ann", None, 20, None, 100)) == "page"
+    assert cache.get(QueryCache.make_key("ann", None, 20, None, 50)) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_query_cache_expires_and_evicts():
+    """Entries expire after the TTL and the least recently used is evicted"""
+    cache = QueryCache(max_entries=2, ttl_seconds=0.05)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, cache.version)
+
+    assert cache.get("a") is None
+    assert cache.get("c") == "c"
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["expirations"] == 1
+
+def test_query_cache_invalidation_drops_stale_results():
+    """A write clears the cache and results computed before it are not stored"""
+    cache = QueryCache()
+    cache.put("a", "old", cache.version)
+    version = cache.version  # captured before a query that races with a write
+
+    cache.invalidate()
+    cache.put("b", "stale", version)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,22 @@
+import time
+from app.replicas import ReplicaSet
+
+def test_replica_set_round_robin():
+    """Each call starts the rotation one replica further"""
+    replicas = ReplicaSet(["a", "b", "c"])
+    firsts = [replicas.candidates()[0] for _ in range(6)]
+
+    assert firsts == [0, 1, 2, 0, 1, 2]
+    assert replicas.candidates() == [0, 1, 2]
+
+def test_replica_set_ejects_and_readmits():
+    """An ejected replica is skipped until eject_seconds have passed"""
+    replicas = ReplicaSet(["a", "b"], eject_seconds=0.05)
+    replicas.eject(0)
+
+    assert [replicas.candidates() for _ in range(2)] == [[1], [1]]
+    assert replicas.stats() == {"replicas": 2, "healthy": 1, "ejections": 1}
+    replicas.eject(1)
+    assert replicas.candidates() == []
+    time.sleep(0.06)
+    assert sorted(replicas.candidates()) == [0, 1]
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+from app.s3_utils import MAX_POOL_CONNECTIONS, client_config, run_s3
+
+def test_client_config_tunes_the_transport():
+    """The S3 client gets a larger pool, adaptive retries, timeouts and keep-alive"""
+    config = client_config()
+
+    assert config.max_pool_connections == MAX_POOL_CONNECTIONS > 10
+    assert config.retries["mode"] == "adaptive"
+    assert config.connect_timeout and config.read_timeout
+    assert config.tcp_keepalive
+
+def test_run_s3_offloads_blocking_calls():
+    """Blocking S3 calls run concurrently on the S3 threads, not on the event loop"""
+    started = threading.Barrier(3, timeout=5)
+
+    def upload(key):
+        started.wait()  # only returns once all three uploads run at the same time
+        return key, threading.current_thread().name
+
+    async def main():
+        return await asyncio.gather(*(run_s3(upload, f"queries/{i}.json") for i in range(3)))
+
+    results = asyncio.run(main())
+
+    assert [key for key, _ in results] == ["queries/0.json", "queries/1.json", "queries/2.json"]
+    assert all(thread.startswith("s3") for _, thread in results)
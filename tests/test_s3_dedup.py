@@ -0,0 +1,40 @@
+from app import s3_utils
+from app.s3_utils import KnownKeys, S3Handler, content_key
+
+def test_content_key_ignores_ordering_and_timestamp():
+    """Equal parameters and results map to the same key, different results do not"""
+    rows = [{"id": 1, "name": "Ann", "age": 30}]
+    key = content_key({"name": "ann", "city": None}, rows)
+
+    assert key.startswith("queries/sha256/")
+    assert content_key({"city": None, "name": "ann"}, [{"age": 30, "name": "Ann", "id": 1}]) == key
+    assert content_key({"name": "ann", "city": None}, rows + rows) != key
+
+def test_identical_archives_are_uploaded_once(fake_s3):
+    """The first put checks S3, later ones are answered by the known-keys cache"""
+    handler = S3Handler(testing=True)
+    handler.s3_client = fake_s3
+    key = content_key({}, [])
+
+    for _ in range(3):
+        handler.put_object(key, "{}", if_absent=True)
+
+    assert handler.s3_client.puts == 1
+    assert handler.s3_client.heads == 1
+
+    # A key uploaded by another process is found with HEAD and not rewritten
+    handler.s3_client.objects["queries/sha256/other.json"] = "{}"
+    handler.put_object("queries/sha256/other.json", "{}", if_absent=True)
+    assert handler.s3_client.puts == 1
+
+def test_known_keys_expire(monkeypatch):
+    """A key is forgotten once its TTL has passed, even if it was hit meanwhile"""
+    now = [100.0]
+    monkeypatch.setattr(s3_utils.time, "monotonic", lambda: now[0])
+    keys = KnownKeys(ttl=60)
+    keys.add("queries/sha256/a.json")
+
+    now[0] = 150.0
+    assert "queries/sha256/a.json" in keys
+    now[0] = 160.0
+    assert "queries/sha256/a.json" not in keys
@@ -0,0 +1,44 @@
+import threading
+from app.s3_writer import S3BackgroundWriter
+
+def test_background_writer_flushes_all_uploads():
+    """Every submitted upload is written by the time flush() returns"""
+    written = {}
+    writer = S3BackgroundWriter(lambda key, body: written.__setitem__(key, body), workers=2, batch_size=4)
+
+    for i in range(20):
+        writer.submit(f"queries/{i}.json", f"body-{i}")
+
+    assert writer.flush(timeout=5)
+    assert len(written) == 20
+    stats = writer.stats()
+    assert stats["enqueued"] == 20
+    assert stats["written"] == 20
+    assert stats["queue_depth"] == 0
+    writer.close()
+
+def test_background_writer_falls_back_to_sync_when_full():
+    """A full queue makes the caller upload synchronously instead of dropping"""
+    release = threading.Event()
+    picked = threading.Event()
+    written = []
+
+    def slow_put(key, body):
+        picked.set()
+        release.wait(5)
+        written.append(key)
+
+    writer = S3BackgroundWriter(slow_put, max_queue=1, workers=1, batch_size=1, enqueue_timeout=0.01)
+    writer.submit("a", "1")  # picked up by the worker, which blocks
+    picked.wait(5)
+    writer.submit("b", "2")  # fills the queue
+
+    threading.Timer(0.1, release.set).start()
+    writer.submit("c", "3")  # queue still full, so this uploads inline
+    writer.close()
+
+    assert sorted(written) == ["a", "b", "c"]
+    stats = writer.stats()
+    assert stats["sync_fallbacks"] == 1
+    assert stats["enqueued"] == 2
+    assert stats["failed"] == 0
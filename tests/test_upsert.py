@@ -0,0 +1,97 @@
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from app import crud
+from app.bloom import BloomFilter
+from app.models import Base, User
+
+def rows(*emails, name="Ann"):
+    return [(name, email, 30, "Springfield") for email in emails]
+
+def memory_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return engine
+
+def test_write_users_skips_or_updates_taken_emails():
+    """Taken emails are counted instead of failing the whole batch"""
+    engine = memory_engine()
+    with engine.begin() as conn:
+        assert crud.write_users(conn, rows("a@x", "b@x"), "skip") == {"inserted": 2, "updated": 0, "skipped": 0}
+    with engine.begin() as conn:
+        # b@x is taken, c@x repeats within the batch
+        counts = crud.write_users(conn, rows("b@x", "c@x", "c@x", name="Bob"), "skip")
+    assert counts == {"inserted": 1, "updated": 0, "skipped": 2}
+    with engine.begin() as conn:
+        crud.write_users(conn, rows("a@x", name="Cat"), "update")
+        names = dict(conn.execute(select(User.email, User.name)).all())
+    assert names == {"a@x": "Cat", "b@x": "Ann", "c@x": "Bob"}
+
+def test_bloom_filter_prefilters_recent_emails(monkeypatch):
+    """Emails the Bloom filter has seen are skipped without a round trip"""
+    bloom = BloomFilter(1000)
+    monkeypatch.setattr(crud, "recent_emails", bloom)
+    engine = memory_engine()
+    with engine.begin() as conn:
+        crud.write_users(conn, rows("a@x", "b@x"), "skip")
+    assert "a@x" in bloom and "z@x" not in bloom
+
+    assert crud.prefilter_emails(rows("a@x", "z@x"), "skip") == rows("z@x")
+    assert crud.prefilter_emails(rows("a@x"), "update") == rows("a@x")
+
+def test_bloom_filter_false_positive_rate():
+    """False positives stay near the configured rate and the filter resets when full"""
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(f"user{i}@example.com")
+    assert all(f"user{i}@example.com" in bloom for i in range(10000))
+    false_positives = sum(f"other{i}@example.com" in bloom for i in range(10000))
+    assert false_positives < 200
+
+    bloom.add("next@example.com")
+    assert bloom.count == 1
+    assert "user0@example.com" not in bloom
+
+def test_delete_clears_bloom_filter(monkeypatch):
+    """Users deleted and generated again are inserted, not skipped by the filter"""
+    monkeypatch.setattr(crud, "recent_emails", BloomFilter(1000))
+    engine = memory_engine()
+    with Session(engine) as db:
+        first = crud.create_users(db, 5, unique="bloom-delete")
+        assert first["inserted"] == 5
+        assert crud.create_users(db, 5, unique="bloom-delete")["skipped"] == 5
+
+        assert crud.delete_users(db, ids=db.scalars(select(User.id)).all()) == 5
+        assert crud.create_users(db, 5, unique="bloom-delete") == first
+
+def test_write_users_stays_under_the_bind_parameter_limit():
+    """A chunk with more parameters than SQLite allows is split into several INSERTs"""
+    engine = memory_engine()
+    emails = [f"user{i}@x" for i in range(10000)]  # 40,000 parameters
+    with engine.begin() as conn:
+        assert crud.write_users(conn, rows(*emails[:9000]), "error")["inserted"] == 9000
+        counts = crud.write_users(conn, rows(*emails), "skip")
+    assert counts == {"inserted": 1000, "updated": 0, "skipped": 9000}
+
+def test_filtered_delete_continues_after_a_short_batch(monkeypatch):
+    """A batch shrunk by a concurrent delete does not end a filtered delete early"""
+    engine = memory_engine()
+    with engine.begin() as conn:
+        crud.write_users(conn, rows(*[f"ann{i}@x" for i in range(10)]), "error")
+    delete_returning = crud._delete_returning
+    calls = []
+
+    def racing_delete(db, condition):
+        calls.append(condition)
+        if len(calls) == 1:
+            # The batch's ids are fixed, then another request removes one of them
+            ids = db.scalars(select(User.id).where(condition)).all()
+            db.execute(delete(User).where(User.id == ids[0]))
+            db.commit()
+            condition = User.id.in_(ids)
+        return delete_returning(db, condition)
+
+    monkeypatch.setattr(crud, "_delete_returning", racing_delete)
+    with Session(engine) as db:
+        assert crud.delete_users(db, name="Ann", batch_size=4) == 9
+        assert db.scalars(select(User.id)).all() == []
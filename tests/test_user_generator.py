@@ -0,0 +1,37 @@
+from app import user_generator
+from app.user_generator import UserGenerator, generate_users
+
+def test_generator_is_deterministic_under_seed():
+    """The same seed yields the same rows whatever the batch size or worker count"""
+    rows = list(UserGenerator(seed=7, vocab_size=50).rows(3000, batch_size=1000))
+
+    assert list(UserGenerator(seed=7, vocab_size=50).rows(3000, batch_size=333)) == rows
+    assert list(UserGenerator(seed=7, vocab_size=50).rows(3000, batch_size=1000, workers=2)) == rows
+    assert UserGenerator(seed=7, vocab_size=50).batch(1500, 10) == rows[1500:1510]
+
+def test_generator_emails_are_unique_by_construction():
+    """Emails never repeat within a run, even with a tiny vocabulary"""
+    rows = list(UserGenerator(seed=1, vocab_size=5).rows(20000))
+
+    assert len({email for _, email, _, _ in rows}) == len(rows)
+    assert all(18 <= age <= 80 for _, _, age, _ in rows)
+
+def test_unseeded_runs_do_not_collide():
+    """Separate unseeded runs get different run tags"""
+    first = {email for _, email, _, _ in generate_users(100)}
+    second = {email for _, email, _, _ in generate_users(100)}
+
+    assert not first & second
+
+def test_worker_processes_are_spawned(monkeypatch):
+    """Worker processes start from a fresh interpreter instead of forking the server"""
+    contexts = []
+    pool = user_generator.ProcessPoolExecutor
+
+    def recording_pool(*args, **kwargs):
+        contexts.append(kwargs["mp_context"].get_start_method())
+        return pool(*args, **kwargs)
+
+    monkeypatch.setattr(user_generator, "ProcessPoolExecutor", recording_pool)
+    assert len(list(UserGenerator(seed=3, vocab_size=20).rows(10, batch_size=5, workers=2))) == 10
+    assert contexts == ["spawn"]
@@ -0,0 +1,27 @@
+from app.workers import cpu_limit, pool_size_per_worker, worker_count
+
+def test_cpu_limit_reads_cgroup_quota(tmp_path):
+    """cgroup v2 and v1 quotas are used; without a limit the usable CPUs are"""
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert cpu_limit(str(tmp_path)) == 1.5
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cpu_limit(str(tmp_path)) >= 1
+
+    (tmp_path / "cpu.max").unlink()
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("50000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert cpu_limit(str(tmp_path)) == 0.5
+
+def test_worker_count_and_pool_budget(monkeypatch):
+    """Workers follow the CPU quota with a floor; the connection budget is split between them"""
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert worker_count(0.5) == 2
+    assert worker_count(3.2) == 4
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert worker_count(8) == 3
+
+    assert pool_size_per_worker(20, 3) == 6
+    assert pool_size_per_worker(2, 4) == 1
+    assert pool_size_per_worker(20, 3, engines=2) == 3